@@ -1,7 +1,9 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+import click
 from datetime import datetime, date, timedelta
 import urllib.parse
 import requests
@@ -15,6 +17,8 @@ from functions import (
     fetch_rakuten_recipes, 
     get_favorite_urls, 
     migrate_database,
+    check_database_revision,
+    apply_sqlite_pragmas,
 )
 from middleware.cathe import cathe_bp
 from middleware.debug import debug_bp
@@ -22,7 +26,8 @@ from middleware.https_redirect import https_bp, IS_HTTPS
 from middleware.login_out import loginout_bp
 from middleware.pwa import pwa_bp
 from middleware.recipe import recipe_bp
-from config import Config
+from middleware.image_proxy import image_bp
+from config import Config, migrations_dir
 # 既存のインポートの後に追加
 from middleware.push_notification import push_bp
 
@@ -38,6 +43,7 @@ app.register_blueprint(https_bp)
 app.register_blueprint(loginout_bp)
 app.register_blueprint(pwa_bp)
 app.register_blueprint(recipe_bp)
+app.register_blueprint(image_bp)
 # 既存のapp.register_blueprint()の後に追加
 app.register_blueprint(push_bp)
 
@@ -56,15 +62,27 @@ def service_worker_root():
 # dbとappの接続
 # ====================
 db.init_app(app)
+migrate = Migrate(app, db, directory=migrations_dir, render_as_batch=True)
 
 
-with app.app_context():
-    db.create_all()
+# デプロイ時に1回だけ実行する: flask --app app migrate-db
+# （Alembic導入前のデータベースのbaseline記録も含めて最新まで適用する）
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """データベースのマイグレーションを最新まで適用する"""
+    migrate_database()
+
 
-# データベース初期化時に実行
+# データベース初期化時に実行（接続ごとのPRAGMAを設定し、マイグレーションを適用または最新か確認）
+# マイグレーションに失敗した・最新でない場合は例外で起動を止める
+# flaskコマンド（migrate-db・db upgradeなど）から読み込まれたときは、古いスキーマのまま実行できるよう確認しない
 with app.app_context():
-    db.create_all()
-    migrate_database()  
+    apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+    print(f"[DB] Profile '{app.config['DB_PROFILE']}': {app.config['SQLITE_PRAGMAS']}")
+    if app.config['DB_AUTO_MIGRATE']:
+        migrate_database()
+    elif click.get_current_context(silent=True) is None:
+        check_database_revision()
 
 if __name__ == '__main__':
     print("=" * 60)
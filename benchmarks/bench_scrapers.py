@@ -0,0 +1,199 @@
+"""
+スクレイピング処理のオフラインベンチマーク
+
+保存済みの検索結果ページ（benchmarks/fixtures/）をローカルのスタブHTTPサーバーから配信し、
+fetch_nadia_recipes / fetch_kurashiru_recipes / fetch_rakuten_recipes を実サイトに接続せずに計測する。
+
+計測内容
+  1. HTML解析：1ページあたりの解析時間とメモリ確保量（パーサーごと）
+  2. 検索全体：3サイト並列検索のレイテンシとスループット（同時実行数ごと）
+キャッシュ・シングルフライト・サーキットブレーカーは外し、毎回スタブサーバーから取得する。
+
+使い方
+  python benchmarks/bench_scrapers.py
+  python benchmarks/bench_scrapers.py --concurrency 1,8,32 --requests 64 --upstream-delay 0.1
+  python benchmarks/bench_scrapers.py --record 玉ねぎ   # 実サイトからfixtureを取り直す
+"""
+import io
+import os
+import sys
+import time
+import inspect
+import argparse
+import contextlib
+import threading
+import tracemalloc
+import statistics
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import functions  # noqa: E402
+import http_client  # noqa: E402
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# サイト名 → (fixtureファイル, スタブサーバーのパス, 解析関数, 取得関数)
+SITES = {
+    'Nadia': ('nadia_search.html', '/nadia/search?q={query}',
+              functions.parse_nadia_html, functions.fetch_nadia_recipes),
+    'クラシル': ('kurashiru_search.html', '/kurashiru/search?query={query}',
+                 functions.parse_kurashiru_html, functions.fetch_kurashiru_recipes),
+    '楽天レシピ': ('rakuten_search.html', '/rakuten/search/{query}',
+                   functions.parse_rakuten_html, functions.fetch_rakuten_recipes),
+}
+
+
+def load_fixture(filename):
+    with open(os.path.join(FIXTURE_DIR, filename), 'rb') as f:
+        return f.read()
+
+
+# ---------- スタブサーバー ----------
+
+def start_stub_server(upstream_delay):
+    pages = {path.split('/')[1]: load_fixture(filename) for filename, path, _, _ in SITES.values()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-aliveを有効にする
+
+        def do_GET(self):
+            body = pages.get(self.path.split('/')[1])
+            if body is None:
+                self.send_error(404)
+                return
+            if upstream_delay:
+                time.sleep(upstream_delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def use_stub_server(server):
+    """検索URLをスタブサーバーに向け、キャッシュ等を外した取得関数で並列検索する"""
+    base = f'http://127.0.0.1:{server.server_port}'
+    for name, (_, path, _, fetcher) in SITES.items():
+        functions.RECIPE_SEARCH_URLS[name] = base + path
+    functions.RECIPE_SOURCES[:] = [(name, inspect.unwrap(fetcher)) for name, (_, _, _, fetcher) in SITES.items()]
+
+
+# ---------- 計測 ----------
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_parse(iterations, parsers):
+    print('\n== HTML解析（1ページあたり） ==')
+    print(f"{'site':<10} {'parser':<12} {'items':>5} {'mean ms':>9} {'p95 ms':>9} {'peak KiB':>10} {'held KiB':>9}")
+    for name, (filename, _, parse, _) in SITES.items():
+        html = load_fixture(filename).decode('utf-8')
+        for parser in parsers:
+            functions.RECIPE_HTML_PARSER = parser
+            items = len(parse(html))  # ウォームアップ
+
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                parse(html)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            # メモリ確保量：解析中のピークと、解析後もGCまで残っている量
+            tracemalloc.start()
+            result = parse(html)
+            held, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+
+            print(f"{name:<10} {parser:<12} {items:>5} {statistics.mean(timings):>9.2f} "
+                  f"{percentile(timings, 0.95):>9.2f} {peak / 1024:>10.1f} {held / 1024:>9.1f}")
+
+
+def bench_search(concurrency_levels, requests_per_level):
+    print('\n== 検索全体（3サイト並列、キャッシュなし） ==')
+    print(f"{'concurrency':>11} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'req/s':>8} {'recipes':>8}")
+    for concurrency in concurrency_levels:
+        latencies = []
+        counts = []
+
+        def one_search(i):
+            start = time.perf_counter()
+            result = functions.fetch_all_recipes(f'玉ねぎ {i}')
+            latencies.append((time.perf_counter() - start) * 1000)
+            counts.append(len(result['recipes']))
+
+        # 検索ごとの[FANOUT]ログは表に混ざらないよう捨てる
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(one_search, range(requests_per_level)))
+        elapsed = time.perf_counter() - start
+
+        print(f"{concurrency:>11} {requests_per_level:>8} {percentile(latencies, 0.5):>9.1f} "
+              f"{percentile(latencies, 0.95):>9.1f} {max(latencies):>9.1f} "
+              f"{requests_per_level / elapsed:>8.1f} {statistics.mean(counts):>8.1f}")
+
+    print('\n== HTTPコネクションプール ==')
+    for host, stats in http_client.get_pool_stats().items():
+        print(f"{host}: {stats}")
+
+
+def record_fixtures(query):
+    """実サイトから検索結果ページを取得してfixtureを保存し直す"""
+    encoded = urllib.parse.quote_plus(query)
+    for name, (filename, _, parse, _) in SITES.items():
+        url = functions.RECIPE_SEARCH_URLS[name].format(query=encoded)
+        response = http_client.http_get(url)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURE_DIR, filename), 'wb') as f:
+            f.write(response.content)
+        print(f"[RECORD] {name}: {len(response.content)} bytes, {len(parse(response.content.decode('utf-8', errors='replace')))} recipes -> {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='レシピスクレイパーのオフラインベンチマーク')
+    parser.add_argument('--iterations', type=int, default=30, help='解析ベンチマークの繰り返し回数')
+    parser.add_argument('--parsers', default=None, help='比較するパーサー（カンマ区切り、既定はインストール済みのもの）')
+    parser.add_argument('--concurrency', default='1,4,16', help='検索ベンチマークの同時実行数（カンマ区切り）')
+    parser.add_argument('--requests', type=int, default=32, help='同時実行数ごとの検索回数')
+    parser.add_argument('--upstream-delay', type=float, default=0.05, help='スタブサーバーの応答遅延（秒）')
+    parser.add_argument('--record', metavar='QUERY', help='実サイトからfixtureを取り直す')
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record)
+        return
+
+    if args.parsers:
+        parsers = args.parsers.split(',')
+    else:
+        parsers = ['html.parser'] + (['lxml'] if functions._DEFAULT_HTML_PARSER == 'lxml' else [])
+    default_parser = functions.RECIPE_HTML_PARSER
+
+    bench_parse(args.iterations, parsers)
+
+    functions.RECIPE_HTML_PARSER = default_parser
+    server = start_stub_server(args.upstream_delay)
+    use_stub_server(server)
+    print(f"\n(stub server: 127.0.0.1:{server.server_port}, upstream delay {args.upstream_delay * 1000:.0f} ms, "
+          f"parser {default_parser}, fan-out workers {functions.RECIPE_FETCH_WORKERS})")
+    bench_search([int(c) for c in args.concurrency.split(',')], args.requests)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import os
+import time
+import threading
+from collections import deque
+from functools import wraps
+
+
+# ====================
+# レシピサイトごとのサーキットブレーカー
+# ====================
+"""
+closed    ：通常通り呼び出す。直近の失敗率・連続失敗数を記録する
+open      ：失敗が続いたサイトは一定時間呼び出さず、すぐにエラーにする
+half_open ：open期間が過ぎたら1件だけ試し、成功すればclosedに戻す
+応答が遅すぎる呼び出し（SLOW_CALL秒以上）も失敗として数える。
+"""
+
+CIRCUIT_WINDOW = float(os.environ.get('CIRCUIT_WINDOW', '60'))  # 失敗率を計算する期間（秒）
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', '10'))  # 失敗率で判定する最小呼び出し数
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', '0.5'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))  # 連続失敗数
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', '30'))
+# 遅い呼び出しの閾値は検索のサイトごとの締め切り（functions.RECIPE_SOURCE_DEADLINE と同じ環境変数）の8割
+# （締め切りより長いと、締め切りで打ち切られた呼び出しが遅いと数えられない。functionsからのimportは循環するため直接読む）
+_SOURCE_DEADLINE = float(os.environ.get('RECIPE_SOURCE_DEADLINE', '5'))
+CIRCUIT_SLOW_CALL = float(os.environ.get('CIRCUIT_SLOW_CALL', str(_SOURCE_DEADLINE * 0.8)))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """サーキットがopenのため呼び出さなかった"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS,
+                 error_rate=CIRCUIT_ERROR_RATE, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 open_seconds=CIRCUIT_OPEN_SECONDS, slow_call=CIRCUIT_SLOW_CALL):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.slow_call = slow_call
+
+        self._lock = threading.Lock()
+        self._calls = deque()  # (時刻, 成功したか, 所要時間)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._probing = False
+        self._rejected = 0
+        self._last_error = None
+
+    def _trim(self, now):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _allow(self):
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected += 1
+                    return False
+                self._state = HALF_OPEN
+                self._probing = False
+                print(f"[CIRCUIT] {self.name} half-open, probing")
+
+            if self._state == HALF_OPEN:
+                # 試しに通すのは1件だけ
+                if self._probing:
+                    self._rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def _record(self, ok, elapsed, error=None):
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, ok, elapsed))
+            self._trim(now)
+
+            if ok:
+                self._consecutive_failures = 0
+                if self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._calls.clear()
+                    print(f"[CIRCUIT] {self.name} recovered, closed")
+                return
+
+            self._consecutive_failures += 1
+            self._last_error = error
+
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            too_many = self._consecutive_failures >= self.failure_threshold
+            too_often = len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate
+            if self._state == CLOSED and (too_many or too_often):
+                self._open(now)
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._probing = False
+        print(f"[CIRCUIT] {self.name} opened: {self._last_error}")
+
+    def call(self, fn, *args, **kwargs):
+        if not self._allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record(False, time.monotonic() - start, str(e))
+            raise
+
+        elapsed = time.monotonic() - start
+        if elapsed >= self.slow_call:
+            self._record(False, elapsed, f'slow call ({elapsed:.1f}s)')
+        else:
+            self._record(True, elapsed)
+        return result
+
+    def state(self):
+        """現在の状態と直近の失敗率・応答時間を返す"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = list(self._calls)
+            state = self._state
+            if state == OPEN and now - self._opened_at >= self.open_seconds:
+                state = HALF_OPEN
+
+            latencies = sorted(elapsed for _, _, elapsed in calls)
+            failures = sum(1 for _, ok, _ in calls if not ok)
+            return {
+                'state': state,
+                'calls': len(calls),
+                'error_rate': round(failures / len(calls), 3) if calls else 0.0,
+                'avg_latency': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                'p95_latency': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                'consecutive_failures': self._consecutive_failures,
+                'rejected': self._rejected,
+                'retry_in': round(max(0.0, self.open_seconds - (now - self._opened_at)), 1) if self._state == OPEN else 0,
+                'last_error': self._last_error,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def get_breaker_states():
+    """全サイトのサーキット状態を返す"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state() for breaker in breakers}
+
+
+def circuit_breaker(name):
+    """fetch関数をサーキットブレーカー越しに呼び出すデコレータ"""
+    breaker = get_breaker(name)
+
+    def decorator(fetcher):
+        @wraps(fetcher)
+        def wrapper(query):
+            return breaker.call(fetcher, query)
+        return wrapper
+    return decorator
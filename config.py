@@ -41,6 +41,76 @@ os.makedirs(instance_dir, exist_ok=True)
 db_path = os.path.join(instance_dir, 'ingredients.db')
 
 
+# マイグレーション（Alembic）のフォルダ
+# exe化された場合は展開先（sys._MEIPASS）に同梱されたものを使う
+migrations_dir = os.path.join(getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__))), 'migrations')
+
+
+
+# ====================
+# データベース（SQLite）の接続設定
+# ====================
+"""
+DB_PROFILE で選ぶ（未指定ならexe化されたデスクトップ版は desktop、それ以外は server）。
+server ：複数スレッド・ワーカーから同時に読み書きする。WALで読み込みを書き込みで止めない
+desktop：1人で使う。メモリ使用量を抑え、電源断に備えて同期を強める
+個別の値は SQLITE_JOURNAL_MODE などの環境変数で上書きできる。
+"""
+DB_PROFILES = {
+    'server': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,  # ミリ秒
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64000,  # 負の値はKiB単位（約64MB）
+            'temp_store': 'MEMORY',
+        },
+        'pool_size': 10,
+        'max_overflow': 20,
+    },
+    'desktop': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'busy_timeout': 3000,
+            'mmap_size': 32 * 1024 * 1024,
+            'cache_size': -8000,
+            'temp_store': 'DEFAULT',
+        },
+        'pool_size': 2,
+        'max_overflow': 4,
+    },
+}
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'desktop' if getattr(sys, 'frozen', False) else 'server')
+if DB_PROFILE not in DB_PROFILES:
+    print(f"[CONFIG] Unknown DB_PROFILE '{DB_PROFILE}', using 'server'")
+    DB_PROFILE = 'server'
+
+# 起動時にマイグレーションを適用するか
+# サーバーではデプロイの手順（flask --app app migrate-db）で1回だけ適用し、各ワーカーは最新か確認するだけにする
+# デスクトップ版は手順を踏めないため、起動時に適用する
+DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', '1' if DB_PROFILE == 'desktop' else '0') == '1'
+
+SQLITE_PRAGMAS = dict(DB_PROFILES[DB_PROFILE]['pragmas'])
+for _name in SQLITE_PRAGMAS:
+    _value = os.environ.get(f'SQLITE_{_name.upper()}')
+    if _value is not None:
+        SQLITE_PRAGMAS[_name] = _value
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', DB_PROFILES[DB_PROFILE]['pool_size'])),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', DB_PROFILES[DB_PROFILE]['max_overflow'])),
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    'connect_args': {
+        # sqlite3側のロック待ちもbusy_timeoutに合わせる（秒）
+        'timeout': int(SQLITE_PRAGMAS['busy_timeout']) / 1000,
+        # バックグラウンドのスレッド（おすすめの再計算など）でもプールの接続を使うため
+        'check_same_thread': False,
+    },
+}
+
 
 IS_HTTPS = is_https_environment()
 FORCE_HTTPS = os.environ.get('FORCE_HTTPS', 'False').lower() == 'true'
@@ -48,6 +118,10 @@ FORCE_HTTPS = os.environ.get('FORCE_HTTPS', 'False').lower() == 'true'
 class Config():
     SQLALCHEMY_DATABASE_URI= f'sqlite:///{db_path}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = SQLALCHEMY_ENGINE_OPTIONS
+    SQLITE_PRAGMAS = SQLITE_PRAGMAS
+    DB_PROFILE = DB_PROFILE
+    DB_AUTO_MIGRATE = DB_AUTO_MIGRATE
 
     # セッション設定
     SECRET_KEY = os.environ.get('SECRET_KEY', 'your-very-secure-secret-key-change-this-in-production')
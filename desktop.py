@@ -2,6 +2,9 @@
 import threading
 # Flaskなどのwebアプリをデスクトップアプリ風に表示できる
 import webview
+import os
+# デスクトップ版のデータベース設定を使う（環境変数で指定されていればそちらを優先）
+os.environ.setdefault('DB_PROFILE', 'desktop')
 import app
 
 
@@ -5,7 +5,7 @@ a = Analysis(
     ['desktop.py'],
     pathex=[],
     binaries=[],
-    datas=[('templates', 'templates'), ('static', 'static'), ('middleware', 'middleware')],
+    datas=[('templates', 'templates'), ('static', 'static'), ('middleware', 'middleware'), ('migrations', 'migrations')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -1,120 +1,427 @@
 from models import db, Ingredient, FavoriteRecipe
-from datetime import date
-from bs4 import BeautifulSoup
-import requests
+from datetime import date, timedelta
+from sqlalchemy import case, func
+from bs4 import BeautifulSoup, SoupStrainer
+from http_client import http_get
+from recipe_cache import cached_recipes, single_flight
+from circuit_breaker import circuit_breaker
+from rate_limiter import rate_limited
+from recipe_index import indexed_recipes
+from normalizer import unique_ingredient_names
+from recipe_dedup import canonical_url
 import urllib.parse
+import re
 import  os
 from pywebpush import webpush, WebPushException
 import json
 from models import PushSubscription
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait, FIRST_COMPLETED
+import time
 
 # 賞味期限チェック関数
+# 期限の区分（期限切れ / 3日以内 / 7日以内）
+EXPIRY_SOON_DAYS = 3
+EXPIRY_WEEK_DAYS = 7
+
+
+def _expiry_bucket(today):
+    """期限の区分を返すSQLのCASE式"""
+    return case(
+        (Ingredient.expiry_date < today, 'expired'),
+        (Ingredient.expiry_date <= today + timedelta(days=EXPIRY_SOON_DAYS), 'expiring_soon'),
+        else_='expiring_week',
+    )
+
+
+def _expiry_count_columns(today):
+    """区分ごとの件数を数える集計列（expired, expiring_soon, expiring_week の順）"""
+    return [
+        func.coalesce(func.sum(case((Ingredient.expiry_date < today, 1), else_=0)), 0),
+        func.coalesce(func.sum(case(
+            (Ingredient.expiry_date.between(today, today + timedelta(days=EXPIRY_SOON_DAYS)), 1), else_=0)), 0),
+        func.coalesce(func.sum(case(
+            (Ingredient.expiry_date > today + timedelta(days=EXPIRY_SOON_DAYS), 1), else_=0)), 0),
+    ]
+
+
+def _alert_range(today):
+    # 期限が7日以内（期限切れを含む）の行だけ。(user_id, expiry_date) のインデックスで範囲検索になる
+    return Ingredient.expiry_date <= today + timedelta(days=EXPIRY_WEEK_DAYS)
+
+
 def get_expiry_notifications(user_id):
-    ingredients = Ingredient.query.filter_by(user_id=user_id).all()
+    """期限切れ・3日以内・7日以内の食材と件数を返す
+
+    区分はSQLで計算し、期限が7日以内の行だけを読む（冷蔵庫全体は読まない）。
+    """
     today = date.today()
-    
-    expired = []
-    expiring_soon = []
-
-    expiring_week = []
-    
-    for ing in ingredients:
-        if ing.expiry_date:
-            days_left = (ing.expiry_date - today).days
-            if days_left < 0:
-                expired.append(ing)
-            elif days_left <= 3:
-                expiring_soon.append(ing)
-            elif days_left <= 7:
-                expiring_week.append(ing)
-    
+    rows = db.session.query(Ingredient, _expiry_bucket(today))\
+        .filter(Ingredient.user_id == user_id, _alert_range(today))\
+        .order_by(Ingredient.id)\
+        .all()
+
+    notifications = {'expired': [], 'expiring_soon': [], 'expiring_week': []}
+    for ing, bucket in rows:
+        notifications[bucket].append(ing)
+    notifications['counts'] = {bucket: len(items) for bucket, items in notifications.items()}
+    return notifications
+
+
+def get_expiry_counts(user_id):
+    """区分ごとの件数だけを1回の集計で返す"""
+    today = date.today()
+    expired, expiring_soon, expiring_week = db.session.query(*_expiry_count_columns(today))\
+        .filter(Ingredient.user_id == user_id, _alert_range(today))\
+        .one()
+    return {'expired': expired, 'expiring_soon': expiring_soon, 'expiring_week': expiring_week}
+
+
+def get_category_stats(user_id):
+    """カテゴリごとの種類数・合計数量・期限切れ・3日以内の件数を1回のGROUP BYで返す"""
+    today = date.today()
+    expired, expiring_soon, _ = _expiry_count_columns(today)
+    rows = db.session.query(
+        Ingredient.category,
+        func.count(Ingredient.id),
+        func.coalesce(func.sum(Ingredient.quantity), 0),
+        expired,
+        expiring_soon,
+    ).filter(Ingredient.user_id == user_id)\
+        .group_by(Ingredient.category)\
+        .all()
     return {
-        'expired': expired,
-        'expiring_soon': expiring_soon,
-        'expiring_week': expiring_week
+        category: {'count': count, 'quantity': quantity, 'expired': expired_count, 'expiring_soon': soon_count}
+        for category, count, quantity, expired_count, soon_count in rows
     }
 
 
+def get_expiry_counts_by_user():
+    """期限切れ・3日以内の食材があるユーザーごとの件数（プッシュ通知の対象の絞り込み用）"""
+    today = date.today()
+    rows = db.session.query(Ingredient.user_id, *_expiry_count_columns(today))\
+        .filter(Ingredient.expiry_date <= today + timedelta(days=EXPIRY_SOON_DAYS))\
+        .group_by(Ingredient.user_id)\
+        .all()
+    return {
+        user_id: {'expired': expired, 'expiring_soon': expiring_soon, 'expiring_week': expiring_week}
+        for user_id, expired, expiring_soon, expiring_week in rows
+    }
+
+
+def _expiring_names(user_id, bucket, limit):
+    """区分に入る食材名を表記揺れをまとめて最大limit件返す"""
+    today = date.today()
+    if bucket == 'expired':
+        condition = Ingredient.expiry_date < today
+    else:
+        condition = Ingredient.expiry_date.between(today, today + timedelta(days=EXPIRY_SOON_DAYS))
+    names = db.session.query(Ingredient.name)\
+        .filter(Ingredient.user_id == user_id, condition)\
+        .order_by(Ingredient.id)\
+        .all()
+    return unique_ingredient_names([name for name, in names], limit=limit)
+
+
 
 
 
 # ---------- レシピ取得関数 ----------
+# サイトごとのキャッシュ保持時間（秒）
+RECIPE_CACHE_TTLS = {
+    'Nadia': int(os.environ.get('RECIPE_CACHE_TTL_NADIA', '1800')),
+    'クラシル': int(os.environ.get('RECIPE_CACHE_TTL_KURASHIRU', '1800')),
+    '楽天レシピ': int(os.environ.get('RECIPE_CACHE_TTL_RAKUTEN', '3600')),  # ランキング表示のため変化が遅い
+}
+
+
+class RecipeSiteError(Exception):
+    """レシピサイトがエラーを返した（サーキットブレーカーの失敗として数える）"""
+
+
+# ---------- HTML解析 ----------
+"""
+検索結果ページ全体ではなく、結果リストの<li>だけをSoupStrainerで解析する。
+パーサーは環境変数 RECIPE_HTML_PARSER で切り替え可能（lxmlがあればlxml、無ければhtml.parser）。
+"""
+try:
+    import lxml  # noqa: F401
+    _DEFAULT_HTML_PARSER = 'lxml'
+except ImportError:
+    _DEFAULT_HTML_PARSER = 'html.parser'
+
+RECIPE_HTML_PARSER = os.environ.get('RECIPE_HTML_PARSER', _DEFAULT_HTML_PARSER)
+MAX_RECIPES_PER_SITE = 15
+
+_NOSCRIPT_IMG_SRC = re.compile(r'<img[^>]*?\ssrc=["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def _class_strainer(tag_name, class_name):
+    # class属性は複数値のため、スペース区切りの1つとして一致するかを見る
+    return SoupStrainer(tag_name, attrs={'class': re.compile(rf'(^|\s){re.escape(class_name)}(\s|$)')})
+
+
+_NADIA_ITEMS = _class_strainer('li', 'recipeList-fullwidth')
+_KURASHIRU_ITEMS = _class_strainer('li', 'DlyMasonry-content')
+_RAKUTEN_ITEMS = _class_strainer('li', 'recipe_ranking__item')
+
+
+def _decode_html(response):
+    """レスポンスのバイト列を1回だけデコードする（charset指定が無ければUTF-8）"""
+    content_type = response.headers.get('Content-Type', '').lower()
+    encoding = response.encoding if 'charset=' in content_type and response.encoding else 'utf-8'
+    return response.content.decode(encoding, errors='replace')
+
+
+def _parse_items(html, strainer):
+    # 一致した<li>だけが解析結果の最上位に並ぶ
+    return BeautifulSoup(html, RECIPE_HTML_PARSER, parse_only=strainer).find_all('li', recursive=False)
+
+
+def _noscript_img_src(noscript_tag):
+    """<noscript>内の画像URLを取り出す（再パースはしない）"""
+    img_tag = noscript_tag.find('img')
+    if img_tag:
+        return img_tag.get('src') or ''
+    # パーサーによっては<noscript>の中身が文字列のままになる
+    match = _NOSCRIPT_IMG_SRC.search(noscript_tag.get_text())
+    return match.group(1) if match else ''
+
+
+def parse_nadia_html(html):
+    recipes = []
+    for item in _parse_items(html, _NADIA_ITEMS)[:MAX_RECIPES_PER_SITE]:
+        title_tag = item.select_one('p.recipe-title a.recipe-titlelink')
+        img_tag = item.select_one('div.photo-frame a img')
+        if title_tag and img_tag:
+            title = title_tag.get_text(strip=True)
+            link = title_tag.get('href')
+            if not link.startswith('http'):
+                link = f"https://oceans-nadia.com{link}"
+            img_url = img_tag.get('src')
+            recipes.append({'title': title, 'url': link, 'img': img_url, 'source': 'Nadia'})
+    return recipes
+
+
+def parse_kurashiru_html(html):
+    recipes = []
+    for item in _parse_items(html, _KURASHIRU_ITEMS)[:MAX_RECIPES_PER_SITE]:
+        title_tag = item.select_one('p.dly-video-item-title-root')
+        link_tag = item.select_one('a.DlyLink[href]')
+        noscript_tag = item.find('noscript')
+        if title_tag and link_tag:
+            title = title_tag.get_text(strip=True)
+            link = link_tag.get('href')
+            if not link.startswith('http'):
+                link = f"https://www.kurashiru.com{link}"
+            img_url = _noscript_img_src(noscript_tag) if noscript_tag else ''
+            recipes.append({'title': title, 'url': link, 'img': img_url, 'source': 'クラシル'})
+    return recipes
+
+
+def parse_rakuten_html(html):
+    recipes = []
+    for item in _parse_items(html, _RAKUTEN_ITEMS)[:MAX_RECIPES_PER_SITE]:
+        link_tag = item.select_one('a.recipe_ranking__link')
+        title_tag = item.select_one('span.recipe_ranking__recipe_title')
+        img_tag = item.find('img')
+        if link_tag and title_tag and img_tag:
+            title = title_tag.get_text(strip=True)
+            link = link_tag.get('href')
+            if not link.startswith('http'):
+                link = f"https://recipe.rakuten.co.jp{link}"
+            img_url = img_tag.get('src')
+            recipes.append({'title': title, 'url': link, 'img': img_url, 'source': '楽天レシピ'})
+    return recipes
+
+
+def _get_page(url):
+    response = http_get(url)
+    # 混雑・障害を示すステータスだけを失敗とする（404等は「結果なし」として扱う）
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RecipeSiteError(f"HTTP {response.status_code} from {url}")
+    return _decode_html(response)
+
+
+# ---------- レシピ取得 ----------
+# 検索ページのURL（ベンチマークではローカルのスタブサーバーに差し替える）
+RECIPE_SEARCH_URLS = {
+    'Nadia': 'https://oceans-nadia.com/search?q={query}',
+    'クラシル': 'https://www.kurashiru.com/search?query={query}',
+    '楽天レシピ': 'https://recipe.rakuten.co.jp/search/{query}',
+}
+
+# 例外はキャッシュ層（cached_recipes）でログに出し、空リストまたは古い結果を返す
+# レート制限はサーキットブレーカーの外側に置き、制限による失敗をサイトの障害として数えない
+# 取得に成功した結果は全文検索インデックス（recipe_index）にも追加する
+@cached_recipes('Nadia', ttl=RECIPE_CACHE_TTLS['Nadia'])
+@single_flight('Nadia')
+@indexed_recipes('Nadia')
+@rate_limited('oceans-nadia.com')
+@circuit_breaker('Nadia')
 def fetch_nadia_recipes(query):
-    encoded_query = urllib.parse.quote_plus(query)
-    url = f'https://oceans-nadia.com/search?q={encoded_query}'
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-    try:
-        response = requests.get(url, headers=headers, timeout=10, verify=True)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        recipes = []
-        for item in soup.select('li.recipeList-fullwidth')[:15]:
-            title_tag = item.select_one('p.recipe-title a.recipe-titlelink')
-            img_tag = item.select_one('div.photo-frame a img')
-            if title_tag and img_tag:
-                title = title_tag.get_text(strip=True)
-                link = title_tag.get('href')
-                if not link.startswith('http'):
-                    link = f"https://oceans-nadia.com{link}"
-                img_url = img_tag.get('src')
-                recipes.append({'title': title, 'url': link, 'img': img_url, 'source': 'Nadia'})
-        return recipes
-    except Exception as e:
-        print(f"[ERROR] Nadia fetch error: {e}")
-        return []
-
+    url = RECIPE_SEARCH_URLS['Nadia'].format(query=urllib.parse.quote_plus(query))
+    return parse_nadia_html(_get_page(url))
+
+@cached_recipes('クラシル', ttl=RECIPE_CACHE_TTLS['クラシル'])
+@single_flight('クラシル')
+@indexed_recipes('クラシル')
+@rate_limited('www.kurashiru.com')
+@circuit_breaker('クラシル')
 def fetch_kurashiru_recipes(query):
-    encoded_query = urllib.parse.quote_plus(query)
-    url = f'https://www.kurashiru.com/search?query={encoded_query}'
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-    try:
-        response = requests.get(url, headers=headers, timeout=10, verify=True)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        recipes = []
-        for item in soup.select('li.DlyMasonry-content')[:15]:
-            title_tag = item.select_one('p.dly-video-item-title-root')
-            link_tag = item.select_one('a.DlyLink[href]')
-            noscript_tag = item.select_one('noscript')
-            if title_tag and link_tag:
-                title = title_tag.get_text(strip=True)
-                link = link_tag.get('href')
-                if not link.startswith('http'):
-                    link = f"https://www.kurashiru.com{link}"
-                img_url = ''
-                if noscript_tag:
-                    img_soup = BeautifulSoup(noscript_tag.decode_contents(), 'html.parser')
-                    img_tag = img_soup.select_one('img')
-                    if img_tag:
-                        img_url = img_tag.get('src')
-                recipes.append({'title': title, 'url': link, 'img': img_url, 'source': 'クラシル'})
-        return recipes
-    except Exception as e:
-        print(f"[ERROR] Kurashiru fetch error: {e}")
-        return []
-
+    url = RECIPE_SEARCH_URLS['クラシル'].format(query=urllib.parse.quote_plus(query))
+    return parse_kurashiru_html(_get_page(url))
+
+@cached_recipes('楽天レシピ', ttl=RECIPE_CACHE_TTLS['楽天レシピ'])
+@single_flight('楽天レシピ')
+@indexed_recipes('楽天レシピ')
+@rate_limited('recipe.rakuten.co.jp')
+@circuit_breaker('楽天レシピ')
 def fetch_rakuten_recipes(query):
-    encoded_query = urllib.parse.quote_plus(query)
-    url = f'https://recipe.rakuten.co.jp/search/{encoded_query}'
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-    try:
-        response = requests.get(url, headers=headers, timeout=10, verify=True)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        recipes = []
-        for item in soup.select('li.recipe_ranking__item')[:15]:
-            link_tag = item.select_one('a.recipe_ranking__link')
-            title_tag = item.select_one('span.recipe_ranking__recipe_title')
-            img_tag = item.select_one('img')
-            if link_tag and title_tag and img_tag:
-                title = title_tag.get_text(strip=True)
-                link = link_tag.get('href')
-                if not link.startswith('http'):
-                    link = f"https://recipe.rakuten.co.jp{link}"
-                img_url = img_tag.get('src')
-                recipes.append({'title': title, 'url': link, 'img': img_url, 'source': '楽天レシピ'})
-        return recipes
-    except Exception as e:
-        print(f"[ERROR] Rakuten fetch error: {e}")
-        return []
+    url = RECIPE_SEARCH_URLS['楽天レシピ'].format(query=urllib.parse.quote_plus(query))
+    return parse_rakuten_html(_get_page(url))
+
+
+# ---------- 複数サイトの並列検索 ----------
+
+# 検索対象サイト（表示順）
+RECIPE_SOURCES = [
+    ('Nadia', fetch_nadia_recipes),
+    ('クラシル', fetch_kurashiru_recipes),
+    ('楽天レシピ', fetch_rakuten_recipes),
+]
+
+# 並列検索の設定（環境変数で上書き可能）
+RECIPE_FETCH_WORKERS = int(os.environ.get('RECIPE_FETCH_WORKERS', '12'))
+RECIPE_TOTAL_DEADLINE = float(os.environ.get('RECIPE_TOTAL_DEADLINE', '6'))
+RECIPE_SOURCE_DEADLINE = float(os.environ.get('RECIPE_SOURCE_DEADLINE', '5'))
+
+# サイトごとの期限（未指定のサイトはRECIPE_SOURCE_DEADLINEを使用）
+RECIPE_SOURCE_DEADLINES = {}
+
+# プロセス全体で共有する上限付きスレッドプール
+_recipe_executor = ThreadPoolExecutor(
+    max_workers=RECIPE_FETCH_WORKERS,
+    thread_name_prefix='recipe-fetch'
+)
+
+
+def fetch_all_recipes(query, total_deadline=None, source_deadlines=None):
+    """全レシピサイトを並列に検索し、期限内に返ってきたサイトの結果だけを返す"""
+    return fetch_recipes_for_queries([query], total_deadline, source_deadlines)[query]
+
+
+def fetch_recipes_for_queries(queries, total_deadline=None, source_deadlines=None):
+    """複数の検索語 × 全サイトをまとめて並列に検索する
+
+    戻り値は検索語ごとに
+    {'recipes': [...], 'counts': {サイト名: 件数}, 'timed_out': [サイト名, ...]}
+    """
+    total_deadline = RECIPE_TOTAL_DEADLINE if total_deadline is None else total_deadline
+    source_deadlines = source_deadlines or RECIPE_SOURCE_DEADLINES
+
+    start = time.monotonic()
+    futures = [
+        (query, name, _recipe_executor.submit(fetcher, query))
+        for query in queries
+        for name, fetcher in RECIPE_SOURCES
+    ]
+
+    results = {query: {'recipes': [], 'counts': {}, 'timed_out': []} for query in queries}
+
+    for query, name, future in futures:
+        result = results[query]
+        # 全体の期限とサイトごとの期限のうち早い方まで待つ
+        deadline = start + min(total_deadline, source_deadlines.get(name, RECIPE_SOURCE_DEADLINE))
+        try:
+            site_recipes = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            result['timed_out'].append(name)
+            print(f"[FANOUT] {name} timed out for '{query}'")
+            continue
+        except Exception as e:
+            print(f"[ERROR] {name} fetch failed: {e}")
+            site_recipes = []
+
+        result['counts'][name] = len(site_recipes)
+        result['recipes'].extend(site_recipes)
+
+    elapsed = time.monotonic() - start
+    for query, result in results.items():
+        print(f"[FANOUT] '{query}' {result['counts']} timed_out={result['timed_out']} ({elapsed:.2f}s)")
+
+    return results
+
+
+
+
+
+
+
+
+def iter_recipes_as_completed(query, total_deadline=None, source_deadlines=None):
+    """全レシピサイトを並列に検索し、終わったサイトから順に結果を返すジェネレータ
+
+    (サイト名, レシピ一覧, 状態) を返す。状態は 'ok' または 'timeout'。
+    """
+    for name, site_results, status in iter_sources_as_completed([query], total_deadline, source_deadlines):
+        yield name, site_results.get(query, []), status
+
+
+def iter_sources_as_completed(queries, total_deadline=None, source_deadlines=None):
+    """複数の検索語 × 全サイトを並列に検索し、サイトごとに全検索語が終わった順に返すジェネレータ
+
+    (サイト名, {検索語: レシピ一覧}, 状態) を返す。
+    状態は 'ok'、期限内に終わらない検索語があった場合は 'timeout'（終わった検索語の結果は含む）。
+    """
+    total_deadline = RECIPE_TOTAL_DEADLINE if total_deadline is None else total_deadline
+    source_deadlines = source_deadlines or RECIPE_SOURCE_DEADLINES
+
+    start = time.monotonic()
+    pending = {}
+    sources = {}  # サイト名 -> {'results': {検索語: レシピ一覧}, 'remaining': 件数, 'timed_out': bool}
+    for name, fetcher in RECIPE_SOURCES:
+        deadline = start + min(total_deadline, source_deadlines.get(name, RECIPE_SOURCE_DEADLINE))
+        sources[name] = {'results': {}, 'remaining': len(queries), 'timed_out': False}
+        for query in queries:
+            future = _recipe_executor.submit(fetcher, query)
+            pending[future] = (name, query, deadline)
+
+    def finish(name):
+        source = sources[name]
+        source['remaining'] -= 1
+        if source['remaining'] == 0:
+            return name, source['results'], 'timeout' if source['timed_out'] else 'ok'
+        return None
+
+    while pending:
+        # 一番近い期限まで、どれかが終わるのを待つ
+        nearest = min(deadline for _, _, deadline in pending.values())
+        done, _ = wait(pending, timeout=max(0, nearest - time.monotonic()), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            name, query, _ = pending.pop(future)
+            try:
+                sources[name]['results'][query] = future.result()
+            except Exception as e:
+                print(f"[ERROR] {name} fetch failed: {e}")
+                sources[name]['results'][query] = []
+            finished = finish(name)
+            if finished:
+                yield finished
+
+        # 期限を過ぎたサイトは打ち切る
+        now = time.monotonic()
+        for future, (name, query, deadline) in list(pending.items()):
+            if deadline <= now and not future.done():
+                future.cancel()
+                del pending[future]
+                sources[name]['timed_out'] = True
+                print(f"[FANOUT] {name} timed out for '{query}'")
+                finished = finish(name)
+                if finished:
+                    yield finished
 
 
 
@@ -128,7 +435,7 @@ def get_priority_ingredient_names(user_id):
     """期限切れ・間近の食材名をリストで返す"""
     notifications = get_expiry_notifications(user_id)
     priority_ingredients = notifications.get('expired', []) + notifications.get('expiring_soon', [])
-    return list(set([ing.name for ing in priority_ingredients[:5]]))  # 最大5つ、重複排除
+    return unique_ingredient_names([ing.name for ing in priority_ingredients], limit=5)  # 最大5つ、表記揺れをまとめて重複排除
 
 
 
@@ -144,26 +451,79 @@ def get_priority_ingredient_names(user_id):
 
 # データベースマイグレーション関数
 # データベースマイグレーション関数
+def apply_sqlite_pragmas(engine, pragmas):
+    """SQLiteの接続ごとにPRAGMAを設定する（接続プールが新しく接続したときに実行）"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+# Alembic導入時点のリビジョン（migrations/versions/3f1a2b7c9d01_baseline.py）
+BASELINE_REVISION = '3f1a2b7c9d01'
+
+
 def migrate_database():
-    """既存データベースにcategoryカラムを追加"""
+    """Alembicのマイグレーションを最新まで適用する（アプリケーションコンテキスト内で呼ぶこと）
+
+    Alembic導入前のデータベース（alembic_versionテーブルが無い）は、
+    足りないテーブル・categoryカラムを補ってからbaselineとして記録し、以降のリビジョンを適用する。
+    失敗した場合は例外をそのまま送出する（途中までのスキーマのまま動かさない）。
+    """
     try:
         from sqlalchemy import text, inspect
-        
-        # インスペクタを使用してカラムの存在を確認
+        from flask_migrate import upgrade, stamp
+
         inspector = inspect(db.engine)
-        columns = [col['name'] for col in inspector.get_columns('ingredient')]
-        
-        if 'category' not in columns:
-            # text()を使用してSQL文を実行
-            with db.engine.connect() as conn:
-                conn.execute(text('ALTER TABLE ingredient ADD COLUMN category VARCHAR(20)'))
-                conn.commit()
-            print("[MIGRATION] categoryカラムを追加しました")
-        else:
-            print("[MIGRATION] categoryカラムは既に存在します")
-            
+        tables = inspector.get_table_names()
+
+        if 'ingredient' in tables and 'alembic_version' not in tables:
+            # baselineに含まれるテーブルのうち、無いものだけ作る
+            baseline_tables = ['user', 'ingredient', 'favorite_recipe', 'recipe_history', 'push_subscription']
+            missing = [db.metadata.tables[name] for name in baseline_tables if name not in tables]
+            if missing:
+                db.metadata.create_all(bind=db.engine, tables=missing)
+
+            columns = [col['name'] for col in inspector.get_columns('ingredient')]
+            if 'category' not in columns:
+                with db.engine.connect() as conn:
+                    conn.execute(text('ALTER TABLE ingredient ADD COLUMN category VARCHAR(20)'))
+                    conn.commit()
+                print("[MIGRATION] categoryカラムを追加しました")
+
+            stamp(revision=BASELINE_REVISION)
+            print("[MIGRATION] 既存のデータベースをbaselineとして記録しました")
+
+        upgrade()
+        print("[MIGRATION] データベースは最新です")
+
     except Exception as e:
         print(f"[MIGRATION ERROR] {e}")
+        raise
+
+
+def check_database_revision():
+    """データベースが最新のリビジョンか確認する（違う場合はRuntimeError。アプリケーションコンテキスト内で呼ぶこと）"""
+    from flask import current_app
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    config = current_app.extensions['migrate'].migrate.get_config()
+    head = ScriptDirectory.from_config(config).get_current_head()
+    with db.engine.connect() as conn:
+        current = MigrationContext.configure(conn).get_current_revision()
+    if current != head:
+        raise RuntimeError(
+            f"データベースのリビジョン {current} が最新（{head}）ではありません。"
+            "デプロイ時に `flask --app app migrate-db` を実行してください"
+        )
+
 
 def migrate_recipe_features():
     """お気に入り・履歴テーブルを作成"""
@@ -188,6 +548,17 @@ def get_favorite_urls(user_id):
     return [fav.url for fav in favorites]
 
 
+def get_favorite_keys(user_id):
+    """お気に入りのURLを正規化したもの（検索結果のハート表示の判定用）"""
+    rows = db.session.query(FavoriteRecipe.url_key).filter_by(user_id=user_id)
+    return {url_key for url_key, in rows}
+
+
+def find_favorite(user_id, url):
+    """正規化したURLが同じお気に入りを返す（計測用パラメータ違いも同じレシピとみなす。無ければNone）"""
+    return FavoriteRecipe.query.filter_by(user_id=user_id, url_key=canonical_url(url)).first()
+
+
 
 
 
@@ -269,39 +640,37 @@ def send_push_notification(user_id, title, body, url=None, icon=None):
 def check_and_send_expiry_notifications():
     """全ユーザーの賞味期限をチェックして通知を送信"""
     try:
-        from models import User
-        users = User.query.all()
+        # 期限切れ・3日以内の食材があるユーザーだけを1回の集計で取り出す
+        counts_by_user = get_expiry_counts_by_user()
         
-        for user in users:
-            notifications = get_expiry_notifications(user.id)
-            
+        for user_id, counts in counts_by_user.items():
             # 賞味期限切れ通知
-            if notifications['expired']:
-                ingredient_names = ', '.join([ing.name for ing in notifications['expired'][:3]])
-                count = len(notifications['expired'])
+            if counts['expired']:
+                ingredient_names = ', '.join(_expiring_names(user_id, 'expired', 3))
+                count = counts['expired']
                 more = f'など{count}個' if count > 3 else f'{count}個'
                 
                 send_push_notification(
-                    user.id,
+                    user_id,
                     '⚠️ 賞味期限切れの食材があります',
                     f'{ingredient_names}{more}の食材が期限切れです',
                     url='/refrigerator'
                 )
             
             # 3日以内通知
-            elif notifications['expiring_soon']:
-                ingredient_names = ', '.join([ing.name for ing in notifications['expiring_soon'][:3]])
-                count = len(notifications['expiring_soon'])
+            elif counts['expiring_soon']:
+                ingredient_names = ', '.join(_expiring_names(user_id, 'expiring_soon', 3))
+                count = counts['expiring_soon']
                 more = f'など{count}個' if count > 3 else f'{count}個'
                 
                 send_push_notification(
-                    user.id,
+                    user_id,
                     '⏰ 賞味期限が近づいています',
                     f'{ingredient_names}{more}の食材が3日以内に期限切れになります',
                     url='/search'
                 )
         
-        print(f"[PUSH] Checked {len(users)} users for expiry notifications")
+        print(f"[PUSH] Checked {len(counts_by_user)} users with expiring ingredients")
         return True
         
     except Exception as e:
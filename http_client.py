@@ -0,0 +1,137 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+
+# ====================
+# レシピサイト用の共有HTTPクライアント
+# ====================
+"""
+全スクレイパーで1つのrequests.Sessionを共有し、ホストごとにkeep-aliveの
+コネクションプールを保持する（TCP/TLSハンドシェイクを毎回やり直さない）。
+urllib3のプールはスレッドセーフなので、並列検索のワーカーからそのまま使える。
+"""
+
+# プール設定（環境変数で上書き可能）
+HTTP_POOL_CONNECTIONS = int(os.environ.get('RECIPE_HTTP_POOL_CONNECTIONS', '10'))  # 保持するホスト数
+HTTP_POOL_MAXSIZE = int(os.environ.get('RECIPE_HTTP_POOL_MAXSIZE', '10'))  # ホストごとの接続数
+HTTP_POOL_BLOCK = os.environ.get('RECIPE_HTTP_POOL_BLOCK', 'False').lower() == 'true'
+HTTP_RETRIES = int(os.environ.get('RECIPE_HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.environ.get('RECIPE_HTTP_BACKOFF', '0.3'))
+HTTP_BACKOFF_MAX = float(os.environ.get('RECIPE_HTTP_BACKOFF_MAX', '1.0'))  # 再試行の待ちの上限（検索の締め切りより十分短く）
+HTTP_TIMEOUT = float(os.environ.get('RECIPE_HTTP_TIMEOUT', '10'))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept-Language': 'ja,en;q=0.8',
+}
+
+
+# ---------- プール統計 ----------
+_stats_lock = threading.Lock()
+_pool_stats = {}
+
+
+def _record(host, key):
+    with _stats_lock:
+        stats = _pool_stats.setdefault(host, {'requests': 0, 'hits': 0, 'new_connections': 0, 'waits': 0})
+        stats[key] += 1
+
+
+def get_pool_stats():
+    """ホストごとのプール統計（リクエスト数・再利用数・新規接続数・待ち数）を返す"""
+    with _stats_lock:
+        return {host: dict(stats) for host, stats in _pool_stats.items()}
+
+
+class _CountingPoolMixin:
+    """接続の取得・新規作成を数えるコネクションプール"""
+
+    def _get_conn(self, timeout=None):
+        # 空きが無い状態で取得しようとした場合は「待ち」として数える
+        if self.pool is not None and self.pool.empty():
+            _record(self.host, 'waits')
+        conn = super()._get_conn(timeout=timeout)
+        _record(self.host, 'requests')
+        # キューには未接続を表すNoneが入っているため、接続済みなら再利用
+        if conn is not None and getattr(conn, 'sock', None) is not None:
+            _record(self.host, 'hits')
+        return conn
+
+    def _new_conn(self):
+        _record(self.host, 'new_connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """統計付きコネクションプールを使うアダプタ"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=1,
+        backoff_factor=HTTP_BACKOFF,
+        backoff_max=HTTP_BACKOFF_MAX,
+        # 429はここで再試行せず、RecipeSiteErrorとしてサーキットブレーカーに数えさせる
+        # Retry-Afterに従うと長い値1つでワーカーが締め切りを越えて止まるので従わない
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = PooledHTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=HTTP_POOL_BLOCK,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """プロセス全体で共有するSessionを返す"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def http_get(url, headers=None, timeout=None, **kwargs):
+    """共有プール経由でGETする"""
+    return get_session().get(
+        url,
+        headers=headers,
+        timeout=HTTP_TIMEOUT if timeout is None else timeout,
+        verify=True,
+        **kwargs
+    )
@@ -0,0 +1,160 @@
+import io
+import os
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import insert, select
+from models import db, Ingredient
+from inventory_stats import StatsDelta, apply_stats_delta, recompute_inventory_stats
+
+
+# ====================
+# 冷蔵庫の中身のインポート・エクスポート（CSV / JSON）
+# ====================
+"""
+家族で共有する冷蔵庫の移行や、バックアップからの復元のために食材をまとめて出し入れする。
+・エクスポートはyield_perで少しずつ読み、1行ずつ書き出してストリーミングする（全件をメモリに載せない）
+・インポートは1行ずつ検証し、IMPORT_BATCH_SIZE件ずつexecutemanyでINSERTする
+  （全体を1トランザクションにして、途中で失敗したら何も入らないようにする）
+"""
+
+EXPORT_FIELDS = ['name', 'category', 'quantity', 'expiry_date']
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '500'))  # DBから一度に読む行数
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '20000'))
+NAME_MAX_LENGTH = Ingredient.name.type.length
+
+
+class InventoryImportError(ValueError):
+    """インポートするファイルの形式が正しくない"""
+
+
+def _export_rows(user_id):
+    statement = select(Ingredient.name, Ingredient.category, Ingredient.quantity, Ingredient.expiry_date)\
+        .where(Ingredient.user_id == user_id)\
+        .order_by(Ingredient.id)\
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    for name, category, quantity, expiry_date in db.session.execute(statement):
+        yield {
+            'name': name,
+            'category': category,
+            'quantity': quantity,
+            'expiry_date': expiry_date.isoformat() if expiry_date else '',
+        }
+
+
+def iter_export_csv(user_id):
+    """CSVを1行ずつ返す（Excelで文字化けしないようにBOM付き）"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for row in _export_rows(user_id):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_export_json(user_id):
+    """JSONの配列を1要素ずつ返す"""
+    yield '['
+    separator = '\n'
+    for row in _export_rows(user_id):
+        row['expiry_date'] = row['expiry_date'] or None
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def _read_rows(stream, fmt):
+    if fmt == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise InventoryImportError('CSVの1行目に name 列が必要です')
+        return reader
+
+    try:
+        data = json.load(io.TextIOWrapper(stream, encoding='utf-8-sig'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InventoryImportError(f'JSONを読み込めません: {e}')
+    if not isinstance(data, list):
+        raise InventoryImportError('JSONは食材の配列にしてください')
+    return data
+
+
+def _clean_row(row, categories):
+    """1行を検証してINSERT用のdictにする（取り込めない行はNone）"""
+    if not isinstance(row, dict):
+        return None
+    name = str(row.get('name') or '').strip()
+    if not name or len(name) > NAME_MAX_LENGTH:
+        return None
+
+    category = str(row.get('category') or '').strip()
+    if category not in categories:
+        category = 'その他'  # /add と同じくデフォルトにフォールバック
+
+    try:
+        quantity = max(1, int(row.get('quantity') or 1))
+    except (ValueError, TypeError):
+        quantity = 1
+
+    expiry_date = None
+    expiry_date_str = str(row.get('expiry_date') or '').strip()
+    if expiry_date_str:
+        try:
+            expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+    return {'name': name, 'category': category, 'quantity': quantity, 'expiry_date': expiry_date}
+
+
+def import_ingredients(user_id, stream, fmt, categories, replace=False):
+    """ファイルから食材を取り込む（(追加した件数, 飛ばした行数) を返す）
+
+    replace=True なら既存の食材を削除してから取り込む（同じトランザクション内）。
+    """
+    rows = _read_rows(stream, fmt)
+    try:
+        if replace:
+            Ingredient.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+        imported = skipped = 0
+        batch = []
+        delta = StatsDelta()
+        for row in rows:
+            if imported + len(batch) >= IMPORT_MAX_ROWS:
+                raise InventoryImportError(f'一度に取り込めるのは{IMPORT_MAX_ROWS}件までです')
+            values = _clean_row(row, categories)
+            if values is None:
+                skipped += 1
+                continue
+            values['user_id'] = user_id
+            batch.append(values)
+            delta.add(values['category'], values['quantity'], values['expiry_date'])
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                db.session.execute(insert(Ingredient), batch)  # executemany
+                imported += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Ingredient), batch)
+            imported += len(batch)
+
+        # 集計も同じトランザクションで更新する（入れ替えの場合は数え直す）
+        if replace:
+            recompute_inventory_stats(user_id)
+        else:
+            apply_stats_delta(user_id, delta)
+        db.session.commit()
+    except (csv.Error, UnicodeDecodeError) as e:
+        db.session.rollback()
+        raise InventoryImportError(f'ファイルを読み込めません: {e}')
+    except Exception:
+        db.session.rollback()
+        raise
+    return imported, skipped
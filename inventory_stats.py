@@ -0,0 +1,204 @@
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Ingredient, InventoryStats
+from functions import EXPIRY_SOON_DAYS, EXPIRY_WEEK_DAYS
+
+
+# ====================
+# ユーザーごとの食材の集計（inventory_stats）
+# ====================
+"""
+ダッシュボードの食材数・/debug のカテゴリ分布・期限の区分ごとの件数を、
+表示のたびに食材テーブルから数え直さず、ユーザーごとの1行を読むだけで返す。
+・食材を追加・削除・変更するエンドポイントは、変更の後・同じトランザクションで差分（StatsDelta）を反映する
+  差分は読んでから書き戻さず、1回のUPDATEで加算する（同時の変更で差分が失われないように）
+・一括操作は start_stats_delta() で書き込みのトランザクションを始めてから、対象の行だけをSQLで集計し、
+  変更前を引き・変更後を足す（集計から変更までの間に他のリクエストが対象の行を変えられない）
+・期限の区分は日付が変わるとずれるため、bucket_dateが今日でない行は最初の読み込み時に数え直す
+  （数え直すまでの間に来た差分は反映しない。数え直しで最新になる）
+"""
+
+BUCKETS = ('expired', 'expiring_soon', 'expiring_week')
+UNCATEGORIZED = '未分類'  # カテゴリがNULLの食材（カテゴリ導入前のデータ）
+
+
+def expiry_bucket(expiry_date, today):
+    """期限切れ・3日以内・7日以内のどれか（それ以外・未設定はNone）"""
+    if expiry_date is None:
+        return None
+    days_left = (expiry_date - today).days
+    if days_left < 0:
+        return 'expired'
+    if days_left <= EXPIRY_SOON_DAYS:
+        return 'expiring_soon'
+    if days_left <= EXPIRY_WEEK_DAYS:
+        return 'expiring_week'
+    return None
+
+
+def _bucket_expr(today):
+    # expiry_bucket() と同じ区分のSQL（NULLはどれにも当たらずNone）
+    return case(
+        (Ingredient.expiry_date < today, 'expired'),
+        (Ingredient.expiry_date <= today + timedelta(days=EXPIRY_SOON_DAYS), 'expiring_soon'),
+        (Ingredient.expiry_date <= today + timedelta(days=EXPIRY_WEEK_DAYS), 'expiring_week'),
+        else_=None,
+    )
+
+
+class StatsDelta:
+    """食材の増減による集計の差分"""
+
+    def __init__(self, today=None):
+        self.today = today or date.today()
+        self.count = 0
+        self.quantity = 0
+        self.categories = {}
+        self.buckets = dict.fromkeys(BUCKETS, 0)
+
+    def _apply(self, category, bucket, count, quantity):
+        category = UNCATEGORIZED if category is None else category
+        self.count += count
+        self.quantity += quantity
+        self.categories[category] = self.categories.get(category, 0) + count
+        if bucket:
+            self.buckets[bucket] += count
+
+    def add(self, category, quantity, expiry_date, sign=1):
+        """食材1件分を足す（sign=-1なら引く）"""
+        self._apply(category, expiry_bucket(expiry_date, self.today), sign, quantity * sign)
+        return self
+
+    def add_ingredient(self, ingredient, sign=1):
+        return self.add(ingredient.category, ingredient.quantity, ingredient.expiry_date, sign)
+
+    def add_quantity(self, diff):
+        """数量だけが変わった場合"""
+        self.quantity += diff
+        return self
+
+    def move_category(self, old_category, new_category, count=1):
+        """カテゴリだけが変わった場合"""
+        old_category = UNCATEGORIZED if old_category is None else old_category
+        self.categories[old_category] = self.categories.get(old_category, 0) - count
+        self.categories[new_category] = self.categories.get(new_category, 0) + count
+        return self
+
+    def add_query(self, *filters, sign=1):
+        """条件に合う行をカテゴリ×区分ごとに1回で集計して足す"""
+        bucket = _bucket_expr(self.today).label('bucket')
+        rows = db.session.query(
+            Ingredient.category,
+            bucket,
+            func.count(Ingredient.id),
+            func.coalesce(func.sum(Ingredient.quantity), 0),
+        ).filter(*filters)\
+            .group_by(Ingredient.category, bucket)\
+            .all()
+        for category, bucket_name, count, quantity in rows:
+            self._apply(category, bucket_name, count * sign, quantity * sign)
+        return self
+
+    def add_rows(self, user_id, ids, sign=1):
+        """一括操作の対象（ユーザーの食材のうちids）を集計して足す（start_stats_delta() の後に呼ぶ）"""
+        return self.add_query(Ingredient.user_id == user_id, Ingredient.id.in_(ids), sign=sign)
+
+
+def start_stats_delta(user_id):
+    """一括操作の差分を作り始める
+
+    集計の行に書き込んで先に書き込みのトランザクションを始める（SQLiteは書き込みの時点でロックを取る）。
+    こうしておくと、この後の変更前の集計からcommitまで、他のリクエストは対象の行を変更できない。
+    """
+    db.session.execute(
+        update(InventoryStats)
+        .where(InventoryStats.user_id == user_id)
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return StatsDelta()
+
+
+def _as_dict(stats):
+    return {
+        'total': stats.total_count,
+        'quantity': stats.total_quantity,
+        'categories': {category: count for category, count in json.loads(stats.category_counts or '{}').items()
+                       if count > 0},
+        'expired': stats.expired_count,
+        'expiring_soon': stats.expiring_soon_count,
+        'expiring_week': stats.expiring_week_count,
+    }
+
+
+def recompute_inventory_stats(user_id, today=None):
+    """食材から数え直して集計の行を作り直す（commitは呼び出し側）"""
+    delta = StatsDelta(today).add_query(Ingredient.user_id == user_id)
+    stats = InventoryStats.query.filter_by(user_id=user_id).first()
+    if stats is None:
+        stats = InventoryStats(user_id=user_id)
+        db.session.add(stats)
+
+    stats.total_count = delta.count
+    stats.total_quantity = delta.quantity
+    stats.category_counts = json.dumps(
+        {category: count for category, count in delta.categories.items() if count}, ensure_ascii=False)
+    stats.expired_count = delta.buckets['expired']
+    stats.expiring_soon_count = delta.buckets['expiring_soon']
+    stats.expiring_week_count = delta.buckets['expiring_week']
+    stats.bucket_date = delta.today
+    stats.updated_at = datetime.utcnow()
+    return stats
+
+
+def apply_stats_delta(user_id, delta):
+    """差分を集計に反映する（食材の変更の後・同じトランザクション内で呼び、commitは呼び出し側）
+
+    まだ無い・日付が変わった集計は更新しない（次の読み込み時に数え直す）。
+    """
+    # カテゴリ別の件数はSQLiteのJSON関数で、変更のあったキーだけ加算する
+    # （カテゴリ名はJSONパスに埋め込まず、json_each / json_object にバインド変数で渡す）
+    category_counts = InventoryStats.category_counts
+    for category, count in delta.categories.items():
+        if count:
+            entries = func.json_each(InventoryStats.category_counts).table_valued('key', 'value')
+            current = select(entries.c.value).where(entries.c.key == category).scalar_subquery()
+            category_counts = func.json_patch(
+                category_counts, func.json_object(category, func.coalesce(current, 0) + count))
+
+    db.session.execute(
+        update(InventoryStats)
+        .where(InventoryStats.user_id == user_id, InventoryStats.bucket_date == delta.today)
+        .values(
+            total_count=InventoryStats.total_count + delta.count,
+            total_quantity=InventoryStats.total_quantity + delta.quantity,
+            category_counts=category_counts,
+            expired_count=InventoryStats.expired_count + delta.buckets['expired'],
+            expiring_soon_count=InventoryStats.expiring_soon_count + delta.buckets['expiring_soon'],
+            expiring_week_count=InventoryStats.expiring_week_count + delta.buckets['expiring_week'],
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_inventory_stats(user_id):
+    """ユーザーの集計を返す（無い・日付が変わっていれば数え直して保存する）"""
+    today = date.today()
+    stats = InventoryStats.query.filter_by(user_id=user_id).first()
+    if stats is not None and stats.bucket_date == today:
+        return _as_dict(stats)
+
+    result = _as_dict(recompute_inventory_stats(user_id, today))
+    try:
+        db.session.commit()
+        print(f"[STATS] Recomputed inventory stats for user {user_id}")
+    except IntegrityError:
+        # 別のリクエストが同時に初回の行を作った（数え直した値はそのまま使える）
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[ERROR] Saving inventory stats failed for user {user_id}: {e}")
+    return result
@@ -1,6 +1,12 @@
-from flask import session, Blueprint, current_app
-from models import User, Ingredient
-from functions import get_expiry_notifications
+from flask import session, Blueprint, current_app, jsonify
+from models import User
+from inventory_stats import get_inventory_stats
+from http_client import get_pool_stats
+from recipe_cache import get_cache_stats
+from circuit_breaker import get_breaker_states
+from rate_limiter import get_rate_limit_stats
+from recipe_index import get_index_stats
+from view_tracker import get_view_tracker_stats
 from middleware.https_redirect import IS_HTTPS
 from middleware.login_out import login_required
 from config import Config
@@ -18,14 +24,8 @@ debug_bp = Blueprint('debug_app', __name__, url_prefix='')
 def debug():
     user_id = session.get('user_id')
     user = User.query.get(user_id) if user_id else None
-    ingredients = Ingredient.query.filter_by(user_id=user_id).all() if user_id else []
-    notifications = get_expiry_notifications(user_id) if user_id else {}
-    
-    # カテゴリ統計を追加
-    category_stats = {}
-    for ing in ingredients:
-        cat = ing.category or '未分類'
-        category_stats[cat] = category_stats.get(cat, 0) + 1
+    # 件数・カテゴリ分布・期限の区分は集計テーブルから読む
+    stats = get_inventory_stats(user_id) if user_id else {}
     
     debug_info = {
         'system_info': {
@@ -34,13 +34,19 @@ def debug():
             'cache_prevention': 'enabled',
             'category_feature': 'enabled'  # 追加
         },
+        'http_pool': get_pool_stats(),
+        'recipe_cache': get_cache_stats(),
+        'recipe_sources': get_breaker_states(),
+        'rate_limits': get_rate_limit_stats(),
+        'recipe_index': get_index_stats(),
+        'view_tracker': get_view_tracker_stats(),
         'user_data': {
-            'ingredients_count': len(ingredients),
-            'category_distribution': category_stats,  # 追加
+            'ingredients_count': stats.get('total', 0),
+            'category_distribution': stats.get('categories', {}),  # 追加
             'notifications': {
-                'expired': len(notifications.get('expired', [])),
-                'expiring_soon': len(notifications.get('expiring_soon', [])),
-                'expiring_week': len(notifications.get('expiring_week', []))
+                'expired': stats.get('expired', 0),
+                'expiring_soon': stats.get('expiring_soon', 0),
+                'expiring_week': stats.get('expiring_week', 0)
             }
         }
     }
@@ -48,3 +54,11 @@ def debug():
     import json
     return f"<pre>{json.dumps(debug_info, indent=2, ensure_ascii=False)}</pre>"
 
+
+
+
+# レシピサイトごとのサーキットブレーカーの状態
+@debug_bp.route('/debug/sources')
+@login_required
+def debug_sources():
+    return jsonify(get_breaker_states())
@@ -0,0 +1,261 @@
+from flask import Blueprint, Response, abort, current_app, redirect, request, url_for
+import os
+import io
+import hmac
+import base64
+import hashlib
+import threading
+import urllib.parse
+from http_client import http_get
+
+# Pillowがあればサムネイルに縮小する（無ければ元の画像をそのままキャッシュする）
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# ====================
+# レシピ画像のプロキシ（縮小したサムネイルをinstance/image_cacheに保存して配信）
+# ====================
+"""
+検索結果の画像を各サイトのCDNから直接読み込まず、1回だけ取得して縮小したものを配信する。
+・URLは署名付き（SECRET_KEYのHMAC）なので、任意のURLの取得には使えない
+・お気に入り・履歴の画像URLはユーザーが送ってくる値のため、署名・取得するのは
+  レシピサイトの画像CDN（IMAGE_PROXY_HOSTS）だけにする。それ以外のホストはプロキシせず元のURLのまま返す
+・内部のホストへ誘導されないよう、取得時にリダイレクトはたどらない
+・保存先は instance/image_cache。合計サイズが上限を超えたら、最後に使われたのが古いものから削除する
+・同じURLのサムネイルは変わらないため、immutableの長期キャッシュとETagを付けて返す
+テンプレートでは {{ recipe.img|thumb }}、JSONでは thumbnail_url(img) を使う。
+"""
+
+IMAGE_THUMB_WIDTH = int(os.environ.get('IMAGE_THUMB_WIDTH', '480'))
+IMAGE_THUMB_QUALITY = int(os.environ.get('IMAGE_THUMB_QUALITY', '80'))
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get('IMAGE_MAX_SOURCE_BYTES', str(8 * 1024 * 1024)))  # 元画像の最大サイズ
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+IMAGE_CACHE_PRUNE_EVERY = int(os.environ.get('IMAGE_CACHE_PRUNE_EVERY', '50'))  # 保存何回ごとに上限を確認するか
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '5'))
+IMAGE_MAX_AGE = 31536000  # 1年
+# プロキシするレシピサイトの画像CDN（カンマ区切り）
+IMAGE_PROXY_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.environ.get(
+        'IMAGE_PROXY_HOSTS',
+        'asset.oceans-nadia.com,video.kurashiru.com,image.space.rakuten.co.jp,recipe.r10s.jp',
+    ).split(',')
+    if host.strip()
+)
+
+image_bp = Blueprint('image_app', __name__, url_prefix='/img')
+
+_locks = {}
+_locks_guard = threading.Lock()
+_writes = 0
+
+
+def _cache_dir():
+    # config → functions → ... の循環importを避けるため遅延import
+    from config import instance_dir
+    return os.path.join(instance_dir, 'image_cache')
+
+
+def _sign(url):
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return hmac.new(key, url.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def _encode(url):
+    return base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode(token):
+    try:
+        return base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _is_proxied_host(url):
+    """レシピサイトの画像CDNのURLか（ユーザー名・ポート指定付きは対象外）"""
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    return (
+        parts.scheme in ('http', 'https')
+        and parts.hostname in IMAGE_PROXY_HOSTS
+        and port is None
+        and parts.username is None
+    )
+
+
+def thumbnail_url(img):
+    """画像URLをプロキシ経由のURLにする（空・画像CDN以外のホストならそのまま）"""
+    if not img or not _is_proxied_host(img):
+        return img or ''
+    return url_for('image_app.thumbnail', signature=_sign(img), token=_encode(img))
+
+
+@image_bp.app_template_filter('thumb')
+def thumb_filter(img):
+    return thumbnail_url(img)
+
+
+def _cache_key(url):
+    # 縮小の設定が変わったら別のファイルになるようにキーに含める
+    variant = f'{IMAGE_THUMB_WIDTH}:{IMAGE_THUMB_QUALITY}:{Image is not None}'
+    return hashlib.sha256(f'{variant}\n{url}'.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(_cache_dir(), key[:2], key)
+
+
+def _read_cached(path):
+    """保存済みの (content_type, 画像) を返す。無ければNone"""
+    try:
+        with open(path, 'rb') as f:
+            content_type, _, body = f.read().partition(b'\n')
+    except FileNotFoundError:
+        return None
+    # 最近使ったものとして更新日時を進める（削除は更新日時の古い順）
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return content_type.decode('ascii'), body
+
+
+def _write_cached(path, content_type, body):
+    global _writes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content_type.encode('ascii') + b'\n' + body)
+    os.replace(tmp_path, path)
+
+    with _locks_guard:
+        _writes += 1
+        should_prune = _writes % IMAGE_CACHE_PRUNE_EVERY == 0
+    if should_prune:
+        prune_image_cache()
+
+
+def prune_image_cache(max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """合計サイズが上限を超えていたら、最後に使われたのが古いものから削除する"""
+    files = []
+    total = 0
+    for root, _, names in os.walk(_cache_dir()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"[IMAGE_CACHE] Pruned {removed} files, {total} bytes left")
+    return removed
+
+
+def _download(url):
+    """元画像を取得する（サイズ上限あり・リダイレクトはたどらない）"""
+    response = http_get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True, allow_redirects=False)
+    try:
+        if response.is_redirect:
+            raise ValueError(f'redirect to {response.headers.get("Location")}')
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith('image/'):
+            raise ValueError(f'not an image: {content_type}')
+
+        body = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            body.extend(chunk)
+            if len(body) > IMAGE_MAX_SOURCE_BYTES:
+                raise ValueError('image too large')
+        return content_type, bytes(body)
+    finally:
+        response.close()
+
+
+def _make_thumbnail(content_type, body):
+    """幅IMAGE_THUMB_WIDTHまで縮小したJPEGにする（Pillowが無い・変換できない場合は元のまま）"""
+    if Image is None or content_type in ('image/gif', 'image/svg+xml'):
+        return content_type, body
+    try:
+        with Image.open(io.BytesIO(body)) as image:
+            image.draft('RGB', (IMAGE_THUMB_WIDTH, IMAGE_THUMB_WIDTH))  # JPEGは読み込み時に縮小する
+            if image.width > IMAGE_THUMB_WIDTH:
+                height = max(1, round(image.height * IMAGE_THUMB_WIDTH / image.width))
+                image = image.resize((IMAGE_THUMB_WIDTH, height), Image.LANCZOS)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=IMAGE_THUMB_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"[IMAGE_PROXY] Thumbnail failed, serving original: {e}")
+        return content_type, body
+    thumbnail = output.getvalue()
+    # 縮小しても小さくならない画像は元のまま返す
+    if len(thumbnail) >= len(body):
+        return content_type, body
+    return 'image/jpeg', thumbnail
+
+
+def _load(url, key):
+    path = _cache_path(key)
+    cached = _read_cached(path)
+    if cached is not None:
+        return cached
+
+    # 同じ画像の同時リクエストは1回の取得にまとめる
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        try:
+            cached = _read_cached(path)
+            if cached is not None:
+                return cached
+            content_type, body = _make_thumbnail(*_download(url))
+            _write_cached(path, content_type, body)
+            return content_type, body
+        finally:
+            with _locks_guard:
+                _locks.pop(key, None)
+
+
+@image_bp.route('/<signature>/<token>')
+def thumbnail(signature, token):
+    url = _decode(token)
+    if not url or not _is_proxied_host(url) or not hmac.compare_digest(signature, _sign(url)):
+        abort(404)
+
+    key = _cache_key(url)
+    etag = f'"{key[:32]}"'
+    headers = {
+        'Cache-Control': f'public, max-age={IMAGE_MAX_AGE}, immutable',
+        'ETag': etag,
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+
+    try:
+        content_type, body = _load(url, key)
+    except Exception as e:
+        # 取得できない場合は元の画像URLに任せる
+        print(f"[IMAGE_PROXY] Fetch failed for {url}: {e}")
+        return redirect(url, code=302)
+
+    return Response(body, mimetype=content_type, headers=headers)
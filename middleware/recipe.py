@@ -1,13 +1,28 @@
-from flask import session, Blueprint, render_template, request, flash, redirect, url_for
+from flask import session, Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context
 from middleware.login_out import login_required
 from datetime import datetime, date
 from models import db, Ingredient, FavoriteRecipe, RecipeHistory
 from functions import(
     get_expiry_notifications, 
-    fetch_nadia_recipes,
-    fetch_kurashiru_recipes,
-    fetch_rakuten_recipes,
-    get_favorite_urls,
+    get_favorite_keys,
+    find_favorite,
+    get_category_stats,
+)
+import json
+from sqlalchemy import func
+from pagination import keyset_page
+from view_tracker import record_view_event, flush_views, mark_history_cleared
+from inventory_io import iter_export_csv, iter_export_json, import_ingredients, InventoryImportError
+from inventory_stats import StatsDelta, start_stats_delta, apply_stats_delta, get_inventory_stats
+from recipe_index import search_recipe_index
+from query_planner import plan_search, run_plan, iter_plan_as_completed
+from recipe_ranking import load_fridge_ranker
+from recipe_dedup import RecipeDeduper, canonical_url
+from middleware.image_proxy import thumbnail_url
+from recommendations import (
+    get_stored_recommendations,
+    schedule_recommendation_refresh,
+    select_recommendation_ingredients,
 )
 
 
@@ -26,14 +41,24 @@ PREDEFINED_CATEGORIES = [
     '野菜', '肉類', '魚介類', '乳製品', '穀類', '調味料', 'その他'
 ]
 
+# 一覧の並び順（keyset_pageのキー。最後はidで順序を確定させる）
+# 賞味期限順は期限未設定を最後にするため、NULLを最大の日付として扱う
+INGREDIENT_SORTS = {
+    None: [(Ingredient.id, False)],  # 登録順
+    'expiry': [(func.coalesce(Ingredient.expiry_date, date.max), False), (Ingredient.id, False)],
+    'name': [(Ingredient.name, False), (Ingredient.id, False)],
+    'quantity': [(Ingredient.quantity, True), (Ingredient.id, False)],
+    'category': [(Ingredient.category, False), (Ingredient.id, False)],
+}
+FAVORITE_ORDER = [(FavoriteRecipe.created_at, True), (FavoriteRecipe.id, True)]
+HISTORY_ORDER = [(RecipeHistory.viewed_at, True), (RecipeHistory.id, True)]
+
 
 # ---------- メインアプリケーション（ページ分離） ----------
 
 # トップ（ダッシュボード）
 # app.pyのダッシュボードルート部分を以下に置き換え
 
-import random
-
 # ダッシュボードルート（修正版）
 @recipe_bp.route('/')
 @login_required
@@ -44,55 +69,43 @@ def dashboard():
     # 賞味期限通知を取得
     notifications = get_expiry_notifications(user_id)
     
-    # 統計情報
-    total_ingredients = Ingredient.query.filter_by(user_id=user_id).count()
-    
-    # 期限切れ間近の食材からおすすめレシピを取得
-    recommended_recipes = []
-    
-    # 期限切れと3日以内期限切れの食材を組み合わせる
-    priority_ingredients = notifications.get('expired', []) + notifications.get('expiring_soon', [])
-    
-    if priority_ingredients:
-        # 最大3つの食材を選択（重複排除）
-        selected_ingredients = list(set([ing.name for ing in priority_ingredients[:3]]))
-        
-        # 各食材でレシピ検索を実行
-        all_recipes = []
-        for ingredient_name in selected_ingredients:
-            try:
-                print(f"[RECIPE_FETCH] Searching recipes for: {ingredient_name}")
-                
-                # 各レシピサイトから検索
-                nadia_recipes = fetch_nadia_recipes(ingredient_name)
-                kurashiru_recipes = fetch_kurashiru_recipes(ingredient_name)
-                rakuten_recipes = fetch_rakuten_recipes(ingredient_name)
-                
-                # 結果を統合
-                site_recipes = nadia_recipes + kurashiru_recipes + rakuten_recipes
-                
-                # 各食材につき最大2つのレシピを選択
-                if site_recipes:
-                    selected = random.sample(site_recipes, min(2, len(site_recipes)))
-                    for recipe in selected:
-                        recipe['ingredient_used'] = ingredient_name  # どの食材で検索したかを記録
-                    all_recipes.extend(selected)
-                    
-            except Exception as e:
-                print(f"[ERROR] Recipe fetch failed for {ingredient_name}: {e}")
-                continue
-        
-        # 全レシピから最大3つをランダム選択
-        if all_recipes:
-            recommended_recipes = random.sample(all_recipes, min(3, len(all_recipes)))
-            print(f"[RECIPE_RECOMMEND] Selected {len(recommended_recipes)} recipes")
+    # 統計情報（集計テーブルから読むだけ）
+    total_ingredients = get_inventory_stats(user_id)['total']
     
+    # おすすめレシピはページ表示後に /api/recommendations から読み込む
     return render_template('dashboard.html', 
                          notifications=notifications,
                          total_ingredients=total_ingredients,
-                         recommended_recipes=recommended_recipes,
                          date=date)
 
+
+# おすすめレシピ（ダッシュボードからJSONで取得）
+@recipe_bp.route('/api/recommendations')
+@login_required
+def recommendations_api():
+    user_id = session.get('user_id')
+    notifications = get_expiry_notifications(user_id)
+    
+    recommended_recipes, updated_at = get_stored_recommendations(user_id, notifications)
+    status = 'ready'
+    
+    # まだ一度も計算されていない場合は裏で計算を予約し、画面側は pending を見て再取得する
+    # （ここで計算するとレシピサイトへの同期リクエストがこの応答を待たせる）
+    if updated_at is None and select_recommendation_ingredients(notifications):
+        schedule_recommendation_refresh(user_id)
+        status = 'pending'
+    
+    for recipe in recommended_recipes:
+        recipe['thumb'] = thumbnail_url(recipe.get('img'))
+    
+    response = jsonify({
+        'status': status,
+        'recipes': recommended_recipes,
+        'updated_at': updated_at.isoformat() if updated_at else None,
+    })
+    response.headers['Cache-Control'] = 'no-store, private'
+    return response
+
 # 冷蔵庫（食材一覧）
 @recipe_bp.route('/refrigerator')
 @login_required
@@ -100,49 +113,52 @@ def refrigerator():
     user_id = session.get('user_id')
     sort = request.args.get('sort')
     category_filter = request.args.get('category')
+    if category_filter not in PREDEFINED_CATEGORIES:
+        category_filter = None
     
     query = Ingredient.query.filter_by(user_id=user_id)
     
     # カテゴリフィルタリング
-    if category_filter and category_filter in PREDEFINED_CATEGORIES:
+    if category_filter:
         query = query.filter_by(category=category_filter)
     
-    ingredients = query.all()
+    # 並び替えはSQLで行い、1ページ分だけ読む
+    ingredients, next_cursor = keyset_page(
+        query, INGREDIENT_SORTS.get(sort, INGREDIENT_SORTS[None]), request.args.get('cursor'))
+    next_url = url_for('recipe_app.refrigerator', sort=sort, category=category_filter, cursor=next_cursor) \
+        if next_cursor else None
     
-    # ソート処理
-    if sort == "expiry":
-        ingredients = sorted(
-            ingredients,
-            key=lambda ing: (
-                (ing.expiry_date - date.today()).days if ing.expiry_date else 9999
-            )
-        )
-    elif sort == "name":
-        ingredients = sorted(ingredients, key=lambda ing: ing.name)
-    elif sort == "quantity":
-        ingredients = sorted(ingredients, key=lambda ing: ing.quantity, reverse=True)
-    elif sort == "category":
-        ingredients = sorted(ingredients, key=lambda ing: ing.category)
-    
-    # 実際に使用されているカテゴリのみ取得
-    used_categories = db.session.query(Ingredient.category).filter_by(user_id=user_id).distinct().all()
-    used_categories = [cat[0] for cat in used_categories if cat[0]]
-    
-    # カテゴリごとにグループ化
-    grouped = {}
-    for ing in ingredients:
-        grouped.setdefault(ing.category, []).append(ing)
+    if request.args.get('fragment'):
+        return _render_fragment('ingredient_list.html', next_url, '#ingredient-list',
+                                items=ingredients, all_categories=PREDEFINED_CATEGORIES, date=date)
+    
+    # カテゴリごとの件数・統計は1回の集計で取得（全件は読まない）
+    category_stats = get_category_stats(user_id)
+    totals = {
+        key: sum(stats[key] for stats in category_stats.values())
+        for key in ('count', 'quantity', 'expired', 'expiring_soon')
+    }
     
     return render_template(
         'refrigerator.html', 
         ingredients=ingredients,
-        grouped=grouped,
+        next_url=next_url,
         sort=sort, 
-        categories=used_categories,
+        category_stats=category_stats,
+        totals=totals,
+        current_stats=category_stats.get(category_filter, totals) if category_filter else totals,
         all_categories=PREDEFINED_CATEGORIES,  # フィルター用
         current_category=category_filter,
         date=date
     )
+
+
+def _render_fragment(list_template, next_url, target, **context):
+    """「もっと見る」で追加する分（一覧の続きと次のボタン）だけを返す"""
+    return render_template('page_fragment.html', list_template=list_template,
+                           next_url=next_url, target=target, **context)
+
+
 # レシピ検索
 @recipe_bp.route('/search', methods=['GET', 'POST'])
 @login_required
@@ -156,23 +172,29 @@ def search():
         
         print(f"[SEARCH] Request from user {user_id}: query='{query}', ingredients={selected_ingredients}")
         
-        combined_query = " ".join(selected_ingredients + ([query] if query else []))
+        # 食材ごとの検索に分けて、キャッシュに無いものだけサイトに問い合わせる
+        plan = plan_search(selected_ingredients, query)
         
-        if combined_query:
+        if plan:
             try:
-                print(f"[SEARCH] Querying with: '{combined_query}'")
-                nadia_recipes = fetch_nadia_recipes(combined_query)
-                kurashiru_recipes = fetch_kurashiru_recipes(combined_query)
-                rakuten_recipes = fetch_rakuten_recipes(combined_query)
+                print(f"[SEARCH] Querying with: {plan}")
+                # 冷蔵庫の食材（期限が近いもの）を多く使うレシピを上に並べる
+                fetched = run_plan(plan, ranker=load_fridge_ranker(user_id))
+
+                # 複数サイト・パラメータ違いで重複したレシピは最初の1件だけ残す
+                deduper = RecipeDeduper()
+                results.extend(deduper.filter(fetched['recipes']))
 
-                results.extend(nadia_recipes)
-                results.extend(kurashiru_recipes)
-                results.extend(rakuten_recipes)
+                for source, count in fetched['counts'].items():
+                    print(f"[SEARCH] {source} recipes: {count}")
+                print(f"[SEARCH] Total recipes fetched: {len(results)} ({len(fetched['recipes']) - len(results)} duplicates removed)")
 
-                print(f"[SEARCH] Nadia recipes: {len(nadia_recipes)}")
-                print(f"[SEARCH] Kurashiru recipes: {len(kurashiru_recipes)}")
-                print(f"[SEARCH] Rakuten recipes: {len(rakuten_recipes)}")
-                print(f"[SEARCH] Total recipes fetched: {len(results)}")
+                # 期限内に応答しなかったサイトは、索引に保存済みの結果で補う
+                if fetched['timed_out']:
+                    indexed = deduper.filter(search_recipe_index(plan.canonical, sources=fetched['timed_out']))
+                    results.extend(indexed)
+                    print(f"[SEARCH] Filled {len(indexed)} recipes from index for {fetched['timed_out']}")
+                    flash(f"{'、'.join(fetched['timed_out'])}の応答が遅いため、保存済みの結果を表示しています")
 
             # ここで取得した結果を出力
                 print(f"[SEARCH] Sample results: {results[:3]}") # 最初の3件を出力
@@ -183,16 +205,68 @@ def search():
                 results = []
     
     ingredients = Ingredient.query.filter_by(user_id=user_id).all()
-    favorite_urls = get_favorite_urls(user_id)
+    # 計測用パラメータ違いなどでも同じレシピと分かるよう、正規化したURLで比較する
+    favorite_keys = get_favorite_keys(user_id)
+    for recipe in results:
+        recipe['is_favorite'] = canonical_url(recipe['url']) in favorite_keys
     
     return render_template('search.html', 
                          ingredients=ingredients, 
                          results=results,
-                         favorite_urls=favorite_urls, 
                          date=date)
 
 
 
+# レシピ検索（ストリーミング版）
+# 各サイトの検索が終わった順に Server-Sent Events で結果を送る
+@recipe_bp.route('/search/stream')
+@login_required
+def search_stream():
+    user_id = session.get('user_id')
+    query = request.args.get('query', '').strip()
+    selected_ingredients = request.args.getlist('selected_ingredients')
+    
+    plan = plan_search(selected_ingredients, query)
+    print(f"[SEARCH_STREAM] Request from user {user_id}: {plan}")
+    
+    # お気に入り状態と冷蔵庫の中身はストリーム開始前に取得しておく
+    favorite_keys = get_favorite_keys(user_id)
+    ranker = load_fridge_ranker(user_id)
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    def generate():
+        total = 0
+        timed_out = []
+        if plan:
+            # 索引に保存済みの結果を先に送り、各サイトの結果が届いたらサイトごとに置き換える
+            indexed = RecipeDeduper().filter(ranker.rank(search_recipe_index(plan.canonical)))
+            for recipe in indexed:
+                recipe['is_favorite'] = canonical_url(recipe['url']) in favorite_keys
+                recipe['thumb'] = thumbnail_url(recipe.get('img'))
+            yield sse('index', {'recipes': indexed})
+
+            # 先に届いたサイトと重複したレシピは送らない
+            deduper = RecipeDeduper()
+            for source, recipes, status in iter_plan_as_completed(plan, ranker=ranker):
+                if status == 'timeout':
+                    timed_out.append(source)
+                recipes = deduper.filter(recipes)
+                for recipe in recipes:
+                    recipe['is_favorite'] = canonical_url(recipe['url']) in favorite_keys
+                    recipe['thumb'] = thumbnail_url(recipe.get('img'))
+                total += len(recipes)
+                yield sse('source', {'source': source, 'status': status, 'recipes': recipes})
+        print(f"[SEARCH_STREAM] Total recipes streamed: {total}")
+        yield sse('done', {'total': total, 'timed_out': timed_out})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache, no-store, private'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx等のバッファリングを無効化
+    return response
+
+
 # ---------- お気に入り機能 ----------
 
 @recipe_bp.route('/add_favorite', methods=['POST'])
@@ -209,11 +283,8 @@ def add_favorite():
         flash('レシピ情報が不完全です')
         return redirect(request.referrer or url_for('recipe_app.search'))
     
-    # 重複チェック（同じURLが既に登録されているか）
-    exists = FavoriteRecipe.query.filter_by(
-        user_id=user_id, 
-        url=url
-    ).first()
+    # 重複チェック（正規化したURLが同じものが既に登録されているか）
+    exists = find_favorite(user_id, url)
     
     if exists:
         flash('このレシピは既にお気に入りに登録されています')
@@ -223,6 +294,7 @@ def add_favorite():
                 user_id=user_id,
                 title=title,
                 url=url,
+                url_key=canonical_url(url),
                 img=img,
                 source=source
             )
@@ -241,13 +313,18 @@ def add_favorite():
 @recipe_bp.route('/favorites')
 @login_required
 def favorites():
-    """お気に入り一覧"""
+    """お気に入り一覧（新しい順にページ送り）"""
     user_id = session.get('user_id')
-    favorites = FavoriteRecipe.query.filter_by(user_id=user_id)\
-        .order_by(FavoriteRecipe.created_at.desc()).all()
+    query = FavoriteRecipe.query.filter_by(user_id=user_id)
+    favorites, next_cursor = keyset_page(query, FAVORITE_ORDER, request.args.get('cursor'))
+    next_url = url_for('recipe_app.favorites', cursor=next_cursor) if next_cursor else None
+    
+    if request.args.get('fragment'):
+        return _render_fragment('favorite_list.html', next_url, '#favorite-list', favorites=favorites)
     
-    print(f"[FAVORITES] User {user_id} has {len(favorites)} favorites")
-    return render_template('favorites.html', favorites=favorites)
+    total = query.count()
+    print(f"[FAVORITES] User {user_id} has {total} favorites")
+    return render_template('favorites.html', favorites=favorites, total=total, next_url=next_url)
 
 
 @recipe_bp.route('/remove_favorite/<int:id>')
@@ -281,8 +358,8 @@ def toggle_favorite():
     if not url:
         return {'status': 'error', 'message': 'URLが指定されていません'}, 400
     
-    # 既存のお気に入りをチェック
-    favorite = FavoriteRecipe.query.filter_by(user_id=user_id, url=url).first()
+    # 既存のお気に入りをチェック（正規化したURLで探す）
+    favorite = find_favorite(user_id, url)
     
     try:
         if favorite:
@@ -300,6 +377,7 @@ def toggle_favorite():
                 user_id=user_id,
                 title=title,
                 url=url,
+                url_key=canonical_url(url),
                 img=img,
                 source=source
             )
@@ -328,57 +406,27 @@ def record_view():
     if not title or not url or not source:
         return '', 400
     
-    try:
-        # 同じURLの履歴が既に存在する場合は更新（最新の閲覧日時に）
-        existing = RecipeHistory.query.filter_by(user_id=user_id, url=url).first()
-        if existing:
-            existing.viewed_at = datetime.utcnow()
-            existing.title = title  # タイトルも更新
-            existing.img = img
-            existing.source = source
-        else:
-            # 新規追加
-            history = RecipeHistory(
-                user_id=user_id,
-                title=title,
-                url=url,
-                img=img,
-                source=source
-            )
-            db.session.add(history)
-        
-        db.session.commit()
-        
-        # 履歴が50件を超えたら古いものを削除
-        history_count = RecipeHistory.query.filter_by(user_id=user_id).count()
-        if history_count > 50:
-            old_records = RecipeHistory.query.filter_by(user_id=user_id)\
-                .order_by(RecipeHistory.viewed_at.asc())\
-                .limit(history_count - 50).all()
-            for record in old_records:
-                db.session.delete(record)
-            db.session.commit()
-            print(f"[HISTORY] Cleaned up old records for user {user_id}")
-        
-        print(f"[HISTORY] Recorded: '{title}' by user {user_id}")
-        return '', 204  # No Content (成功)
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"[ERROR] Record view failed: {e}")
-        return '', 500
+    # 書き込みは裏でまとめて行う（write-behind）ので、ここではバッファに積むだけ
+    record_view_event(user_id, title, url, img, source)
+    return '', 204  # No Content (成功)
 
 
 @recipe_bp.route('/history')
 @login_required
 def history():
-    """閲覧履歴一覧"""
+    """閲覧履歴一覧（新しい順にページ送り）"""
     user_id = session.get('user_id')
-    history = RecipeHistory.query.filter_by(user_id=user_id)\
-        .order_by(RecipeHistory.viewed_at.desc()).all()
+    flush_views()  # まだ書き込まれていない閲覧を反映
+    query = RecipeHistory.query.filter_by(user_id=user_id)
+    history, next_cursor = keyset_page(query, HISTORY_ORDER, request.args.get('cursor'))
+    next_url = url_for('recipe_app.history', cursor=next_cursor) if next_cursor else None
     
-    print(f"[HISTORY] User {user_id} has {len(history)} history records")
-    return render_template('history.html', history=history)
+    if request.args.get('fragment'):
+        return _render_fragment('history_list.html', next_url, '#history-list', history=history)
+    
+    total = query.count()
+    print(f"[HISTORY] User {user_id} has {total} history records")
+    return render_template('history.html', history=history, total=total, next_url=next_url)
 
 
 @recipe_bp.route('/clear_history')
@@ -386,9 +434,12 @@ def history():
 def clear_history():
     """閲覧履歴を全てクリア"""
     user_id = session.get('user_id')
+    flush_views()  # 後から書き込まれて履歴が復活しないように先に反映
     
     try:
         deleted_count = RecipeHistory.query.filter_by(user_id=user_id).delete()
+        # 他のワーカーのバッファに残っている閲覧も、書き込み時に捨てられるようにする
+        mark_history_cleared(user_id)
         db.session.commit()
         print(f"[HISTORY] Cleared {deleted_count} records for user {user_id}")
         flash(f'{deleted_count}件の閲覧履歴をクリアしました')
@@ -405,6 +456,7 @@ def clear_history():
 def remove_history(id):
     """閲覧履歴から個別に削除"""
     user_id = session.get('user_id')
+    flush_views()
     history_item = RecipeHistory.query.filter_by(id=id, user_id=user_id).first_or_404()
     
     title = history_item.title
@@ -465,8 +517,10 @@ def add_ingredient():
         
         try:
             db.session.add(ingredient)
+            apply_stats_delta(user_id, StatsDelta().add_ingredient(ingredient))
             db.session.commit()
             print(f"[ADD] Success: '{name}' (category: {category})")
+            schedule_recommendation_refresh(user_id)
             flash(f'食材「{name}」を追加しました')
             return redirect(url_for('recipe_app.refrigerator'))
         except Exception as e:
@@ -486,8 +540,10 @@ def delete_ingredient(id):
     ingredient_name = ingredient.name
     try:
         db.session.delete(ingredient)
+        apply_stats_delta(user_id, StatsDelta().add_ingredient(ingredient, sign=-1))
         db.session.commit()
         print(f"[DELETE] Success: '{ingredient_name}' deleted by user {user_id}")
+        schedule_recommendation_refresh(user_id)
         flash(f'食材「{ingredient_name}」を削除しました')
     except Exception as e:
         db.session.rollback()
@@ -510,6 +566,8 @@ def change_quantity(id, action):
         ingredient.quantity -= 1
     
     try:
+        if ingredient.quantity != old_quantity:
+            apply_stats_delta(user_id, StatsDelta().add_quantity(ingredient.quantity - old_quantity))
         db.session.commit()
         print(f"[QUANTITY] Success: {ingredient.name} {old_quantity} -> {ingredient.quantity}")
     except Exception as e:
@@ -536,15 +594,20 @@ def bulk_delete():
         # 選択された食材IDを整数に変換
         ids = [int(id) for id in ingredient_ids]
         
+        # 集計からは削除する行の分を引く
+        delta = start_stats_delta(user_id).add_rows(user_id, ids, sign=-1)
+        
         # ユーザーの食材のみを削除
         deleted_count = Ingredient.query.filter(
             Ingredient.id.in_(ids),
             Ingredient.user_id == user_id
         ).delete(synchronize_session=False)
         
+        apply_stats_delta(user_id, delta)
         db.session.commit()
         
         print(f"[BULK_DELETE] User {user_id} deleted {deleted_count} ingredients")
+        schedule_recommendation_refresh(user_id)
         flash(f'{deleted_count}件の食材を削除しました')
         
     except Exception as e:
@@ -573,6 +636,7 @@ def bulk_change_category():
     try:
         # 選択された食材IDを整数に変換
         ids = [int(id) for id in ingredient_ids]
+        delta = start_stats_delta(user_id).add_rows(user_id, ids, sign=-1)
         
         # ユーザーの食材のみを更新
         updated_count = Ingredient.query.filter(
@@ -580,6 +644,8 @@ def bulk_change_category():
             Ingredient.user_id == user_id
         ).update({'category': new_category}, synchronize_session=False)
         
+        # 集計は変更前の分を引いて変更後の分を足す
+        apply_stats_delta(user_id, delta.add_rows(user_id, ids))
         db.session.commit()
         
         print(f"[BULK_CATEGORY] User {user_id} updated {updated_count} ingredients to {new_category}")
@@ -605,25 +671,28 @@ def bulk_change_quantity():
         flash('数量を変更する食材を選択してください')
         return redirect(url_for('recipe_app.refrigerator'))
     
+    # 数量はSQLの式で1回のUPDATEにする（負の値の加算・減算でも1未満にならないようにSQLiteのmax()で下限を付ける）
+    quantity_updates = {
+        'set': lambda value: max(1, value),
+        'add': lambda value: func.max(Ingredient.quantity + value, 1),
+        'subtract': lambda value: func.max(Ingredient.quantity - value, 1),
+    }
+    if action not in quantity_updates:
+        flash('無効な操作です')
+        return redirect(url_for('recipe_app.refrigerator'))
+    
     try:
         quantity_value = int(quantity_value)
         ids = [int(id) for id in ingredient_ids]
+        delta = start_stats_delta(user_id).add_rows(user_id, ids, sign=-1)
         
-        ingredients = Ingredient.query.filter(
+        # ユーザーの食材のみを更新
+        updated_count = Ingredient.query.filter(
             Ingredient.id.in_(ids),
             Ingredient.user_id == user_id
-        ).all()
-        
-        updated_count = 0
-        for ing in ingredients:
-            if action == 'set':
-                ing.quantity = max(1, quantity_value)
-            elif action == 'add':
-                ing.quantity += quantity_value
-            elif action == 'subtract':
-                ing.quantity = max(1, ing.quantity - quantity_value)
-            updated_count += 1
+        ).update({'quantity': quantity_updates[action](quantity_value)}, synchronize_session=False)
         
+        apply_stats_delta(user_id, delta.add_rows(user_id, ids))
         db.session.commit()
         
         print(f"[BULK_QUANTITY] User {user_id} updated {updated_count} ingredients")
@@ -638,6 +707,66 @@ def bulk_change_quantity():
 
 
 
+# ---------- インポート・エクスポート ----------
+
+@recipe_bp.route('/export')
+@login_required
+def export_ingredients():
+    """冷蔵庫の中身をCSV / JSONでダウンロード（ストリーミング）"""
+    user_id = session.get('user_id')
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        return '', 400
+    
+    print(f"[EXPORT] User {user_id} exporting as {fmt}")
+    if fmt == 'csv':
+        body, mimetype = iter_export_csv(user_id), 'text/csv'
+    else:
+        body, mimetype = iter_export_json(user_id), 'application/json'
+    filename = f"refrigerator_{date.today().strftime('%Y%m%d')}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@recipe_bp.route('/import', methods=['POST'])
+@login_required
+def import_ingredients_file():
+    """CSV / JSONファイルから食材をまとめて追加（replace=1なら入れ替え）"""
+    user_id = session.get('user_id')
+    upload = request.files.get('file')
+    
+    if not upload or not upload.filename:
+        flash('インポートするファイルを選択してください')
+        return redirect(url_for('recipe_app.refrigerator'))
+    
+    fmt = upload.filename.rsplit('.', 1)[-1].lower()
+    if fmt not in ('csv', 'json'):
+        flash('CSVまたはJSONファイルを選択してください')
+        return redirect(url_for('recipe_app.refrigerator'))
+    
+    replace = request.form.get('mode') == 'replace'
+    try:
+        imported, skipped = import_ingredients(user_id, upload.stream, fmt, PREDEFINED_CATEGORIES, replace=replace)
+    except InventoryImportError as e:
+        flash(f'インポートできませんでした: {e}')
+        return redirect(url_for('recipe_app.refrigerator'))
+    except Exception as e:
+        print(f"[ERROR] Import failed: {e}")
+        flash('インポート中にエラーが発生しました')
+        return redirect(url_for('recipe_app.refrigerator'))
+    
+    print(f"[IMPORT] User {user_id} imported {imported} ingredients (skipped {skipped}, replace={replace})")
+    schedule_recommendation_refresh(user_id)
+    message = f'{imported}件の食材をインポートしました'
+    if skipped:
+        message += f'（{skipped}行は形式が正しくないため飛ばしました）'
+    flash(message)
+    return redirect(url_for('recipe_app.refrigerator'))
+
+
 @recipe_bp.route('/edit_category/<int:id>', methods=['POST'])
 @login_required  
 def edit_category(id):
@@ -655,6 +784,7 @@ def edit_category(id):
     ingredient.category = new_category
     
     try:
+        apply_stats_delta(user_id, StatsDelta().move_category(old_category, new_category))
         db.session.commit()
         print(f"[CATEGORY] Updated: {ingredient.name} {old_category} -> {new_category}")
         flash(f'「{ingredient.name}」のカテゴリを「{new_category}」に変更しました')
@@ -0,0 +1,35 @@
+"""ダッシュボードのおすすめレシピ（recipe_recommendation）
+
+Revision ID: 8b2d4e6f1a03
+Revises: 3f1a2b7c9d01
+Create Date: 2026-10-17 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a03'
+down_revision = '3f1a2b7c9d01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Alembic導入前に db.create_all() で作成済みのデータベースもあるため、無い場合だけ作る
+    op.create_table('recipe_recommendation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recipes', sa.Text(), nullable=False),
+    sa.Column('ingredient_key', sa.String(length=500), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('recipe_recommendation')
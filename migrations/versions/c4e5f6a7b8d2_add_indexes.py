@@ -0,0 +1,50 @@
+"""ユーザーごとの検索・並べ替えに使う複合インデックスとユニーク制約
+
+Revision ID: c4e5f6a7b8d2
+Revises: 8b2d4e6f1a03
+Create Date: 2026-10-17 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e5f6a7b8d2'
+down_revision = '8b2d4e6f1a03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ユニークインデックスを張る前に、同じユーザー・同じURLの重複行を1件にまとめる
+    # お気に入りは最初に登録したもの、履歴は最後に閲覧したものを残す
+    op.execute(
+        'DELETE FROM favorite_recipe WHERE id NOT IN '
+        '(SELECT MIN(id) FROM favorite_recipe GROUP BY user_id, url)'
+    )
+    op.execute(
+        'DELETE FROM recipe_history WHERE id NOT IN ('
+        'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+        'PARTITION BY user_id, url ORDER BY viewed_at DESC, id DESC) AS rn FROM recipe_history) '
+        'WHERE rn = 1)'
+    )
+
+    # 新しいデータベースでは db.create_all() 済みの場合もあるため if_not_exists を付ける
+    op.create_index('ix_ingredient_user_expiry', 'ingredient', ['user_id', 'expiry_date'], unique=False, if_not_exists=True)
+    op.create_index('ix_ingredient_user_category', 'ingredient', ['user_id', 'category'], unique=False, if_not_exists=True)
+    op.create_index('ux_favorite_recipe_user_url', 'favorite_recipe', ['user_id', 'url'], unique=True, if_not_exists=True)
+    op.create_index('ix_favorite_recipe_user_created', 'favorite_recipe', ['user_id', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('ux_recipe_history_user_url', 'recipe_history', ['user_id', 'url'], unique=True, if_not_exists=True)
+    op.create_index('ix_recipe_history_user_viewed', 'recipe_history', ['user_id', 'viewed_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_push_subscription_user_id', 'push_subscription', ['user_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_push_subscription_user_id', table_name='push_subscription')
+    op.drop_index('ix_recipe_history_user_viewed', table_name='recipe_history')
+    op.drop_index('ux_recipe_history_user_url', table_name='recipe_history')
+    op.drop_index('ix_favorite_recipe_user_created', table_name='favorite_recipe')
+    op.drop_index('ux_favorite_recipe_user_url', table_name='favorite_recipe')
+    op.drop_index('ix_ingredient_user_category', table_name='ingredient')
+    op.drop_index('ix_ingredient_user_expiry', table_name='ingredient')
@@ -0,0 +1,40 @@
+"""ユーザーごとの食材の集計（inventory_stats）
+
+Revision ID: d7a9b1c3e5f4
+Revises: c4e5f6a7b8d2
+Create Date: 2026-10-17 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a9b1c3e5f4'
+down_revision = 'c4e5f6a7b8d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 既存ユーザーの行は作らない（初回の表示時に食材から数え直して作る）
+    op.create_table('inventory_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.Column('total_quantity', sa.Integer(), nullable=False),
+    sa.Column('category_counts', sa.Text(), nullable=False),
+    sa.Column('expired_count', sa.Integer(), nullable=False),
+    sa.Column('expiring_soon_count', sa.Integer(), nullable=False),
+    sa.Column('expiring_week_count', sa.Integer(), nullable=False),
+    sa.Column('bucket_date', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('inventory_stats')
@@ -0,0 +1,32 @@
+"""閲覧履歴を全てクリアした日時（recipe_history_clear）
+
+Revision ID: e2b4c6d8f0a1
+Revises: d7a9b1c3e5f4
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b4c6d8f0a1'
+down_revision = 'd7a9b1c3e5f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recipe_history_clear',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('cleared_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id'),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('recipe_history_clear')
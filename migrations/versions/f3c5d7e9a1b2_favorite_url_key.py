@@ -0,0 +1,51 @@
+"""お気に入りの正規化したURL（favorite_recipe.url_key）
+
+Revision ID: f3c5d7e9a1b2
+Revises: e2b4c6d8f0a1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from recipe_dedup import canonical_url
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c5d7e9a1b2'
+down_revision = 'e2b4c6d8f0a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # 新しいデータベースでは db.create_all() 済みの場合もある（SQLiteはADD COLUMN IF NOT EXISTSが無いので確認する）
+    columns = [column['name'] for column in sa.inspect(bind).get_columns('favorite_recipe')]
+    if 'url_key' not in columns:
+        op.add_column('favorite_recipe', sa.Column('url_key', sa.String(length=500), nullable=True))
+
+    # 正規化はPython側の処理なので、既存の行を読んで埋める
+    # 同じユーザーで正規化したURLが同じものは、最初に登録したものだけ残す
+    rows = bind.execute(sa.text('SELECT id, user_id, url FROM favorite_recipe ORDER BY id')).fetchall()
+    seen = set()
+    duplicates = []
+    updates = []
+    for favorite_id, user_id, url in rows:
+        key = canonical_url(url)
+        if (user_id, key) in seen:
+            duplicates.append({'id': favorite_id})
+            continue
+        seen.add((user_id, key))
+        updates.append({'id': favorite_id, 'url_key': key})
+    if duplicates:
+        bind.execute(sa.text('DELETE FROM favorite_recipe WHERE id = :id'), duplicates)
+    if updates:
+        bind.execute(sa.text('UPDATE favorite_recipe SET url_key = :url_key WHERE id = :id'), updates)
+
+    op.create_index('ux_favorite_recipe_user_key', 'favorite_recipe', ['user_id', 'url_key'], unique=True, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ux_favorite_recipe_user_key', table_name='favorite_recipe')
+    op.drop_column('favorite_recipe', 'url_key')
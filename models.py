@@ -26,12 +26,19 @@ class Ingredient(db.Model):
     category = db.Column(db.String(50), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # 一覧・期限チェックはユーザーごとに期限順・カテゴリ別で読むため
+    __table_args__ = (
+        db.Index('ix_ingredient_user_expiry', 'user_id', 'expiry_date'),
+        db.Index('ix_ingredient_user_category', 'user_id', 'category'),
+    )
+
 # お気に入りレシピ
 class FavoriteRecipe(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     url = db.Column(db.String(500), nullable=False)
+    url_key = db.Column(db.String(500), nullable=True)  # 正規化したURL（recipe_dedup.canonical_url）
     img = db.Column(db.String(500), nullable=True)
     source = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -39,6 +46,13 @@ class FavoriteRecipe(db.Model):
     # ユーザーとのリレーション
     user = db.relationship('User', backref=db.backref('favorites', lazy=True))
 
+    # 同じレシピは1ユーザーにつき1件（計測用パラメータ違いなどのURLは正規化したURLで同じものとみなす）
+    __table_args__ = (
+        db.Index('ux_favorite_recipe_user_url', 'user_id', 'url', unique=True),
+        db.Index('ux_favorite_recipe_user_key', 'user_id', 'url_key', unique=True),
+        db.Index('ix_favorite_recipe_user_created', 'user_id', 'created_at'),
+    )
+
 # レシピ閲覧履歴
 class RecipeHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,12 +66,45 @@ class RecipeHistory(db.Model):
     # ユーザーとのリレーション
     user = db.relationship('User', backref=db.backref('history', lazy=True))
 
+    # 同じレシピの履歴は1ユーザーにつき1件（閲覧日時を更新する）、一覧は新しい順
+    __table_args__ = (
+        db.Index('ux_recipe_history_user_url', 'user_id', 'url', unique=True),
+        db.Index('ix_recipe_history_user_viewed', 'user_id', 'viewed_at'),
+    )
+
+# 閲覧履歴を全てクリアした日時（これより前の閲覧は、他のプロセスのバッファから後で書き込まれても消す）
+class RecipeHistoryClear(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    cleared_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# ダッシュボード用のおすすめレシピ（バックグラウンドで事前計算）
+class RecipeRecommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    recipes = db.Column(db.Text, nullable=False, default='[]')  # レシピのJSON配列
+    ingredient_key = db.Column(db.String(500), nullable=False, default='')  # 計算に使った食材名
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# ユーザーごとの食材の集計（追加・削除などのたびに差分で更新し、日付が変わったら期限の区分を数え直す）
+class InventoryStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    total_count = db.Column(db.Integer, nullable=False, default=0)  # 食材の種類数
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    category_counts = db.Column(db.Text, nullable=False, default='{}')  # カテゴリ -> 件数 のJSON
+    expired_count = db.Column(db.Integer, nullable=False, default=0)
+    expiring_soon_count = db.Column(db.Integer, nullable=False, default=0)  # 3日以内
+    expiring_week_count = db.Column(db.Integer, nullable=False, default=0)  # 4〜7日
+    bucket_date = db.Column(db.Date, nullable=False)  # 期限の区分を計算した日
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class PushSubscription(db.Model):
     """プッシュ通知の購読情報を管理"""
     __tablename__ = 'push_subscription'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     endpoint = db.Column(db.String(500), nullable=False, unique=True)
     p256dh = db.Column(db.String(200), nullable=False)
     auth = db.Column(db.String(50), nullable=False)
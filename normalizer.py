@@ -0,0 +1,137 @@
+import unicodedata
+from functools import lru_cache
+
+
+# ====================
+# 食材名の正規化と同義語辞書
+# ====================
+"""
+「玉ねぎ」「たまねぎ」「タマネギ」「玉葱」のような表記揺れを同じ食材として扱う。
+・ingredient_key(name)       ：比較・重複排除用のキー（全角/半角・大文字/小文字・カタカナ/ひらがなを揃える）
+・canonical_ingredient(name) ：検索に使う代表表記（同義語辞書にあれば代表表記、無ければNFKC正規化した名前）
+同義語辞書は起動時に「キー → 代表表記」の表に展開しておき、毎リクエストの変換は辞書引きだけで済ませる。
+"""
+
+# 代表表記 → 表記揺れ・別名（代表表記はレシピサイトで検索したときに結果が多い表記）
+INGREDIENT_SYNONYMS = {
+    '玉ねぎ': ['たまねぎ', '玉葱', 'オニオン'],
+    '新玉ねぎ': ['新たまねぎ', '新玉葱', '新玉'],
+    '長ねぎ': ['ながねぎ', '長葱', '白ねぎ', '白葱'],
+    'にんじん': ['人参', 'キャロット'],
+    'じゃがいも': ['じゃが芋', '馬鈴薯', 'ポテト'],
+    'さつまいも': ['さつま芋', '薩摩芋'],
+    '里芋': ['さといも'],
+    '大根': ['だいこん'],
+    'キャベツ': ['甘藍'],
+    '白菜': ['はくさい'],
+    'ほうれん草': ['ほうれんそう', '菠薐草'],
+    '小松菜': ['こまつな'],
+    'きゅうり': ['胡瓜'],
+    'なす': ['茄子', 'なすび'],
+    'かぼちゃ': ['南瓜'],
+    'ごぼう': ['牛蒡'],
+    'れんこん': ['蓮根'],
+    'しいたけ': ['椎茸'],
+    'しめじ': ['占地'],
+    'えのき': ['えのきだけ', 'えのき茸'],
+    'しょうが': ['生姜', '生薑'],
+    'にんにく': ['大蒜', 'ガーリック'],
+    'トマト': [],
+    'ミニトマト': ['プチトマト'],
+    'ピーマン': [],
+    'もやし': ['萌やし'],
+    'ブロッコリー': ['ブロッコリ'],
+    'レタス': [],
+    '卵': ['たまご', '玉子', '鶏卵', '生卵'],
+    '牛乳': ['ぎゅうにゅう', 'ミルク'],
+    '豆腐': ['とうふ'],
+    '油揚げ': ['あぶらあげ', '油揚'],
+    '納豆': ['なっとう'],
+    '鶏肉': ['とり肉', '鳥肉', 'チキン'],
+    '鶏もも肉': ['鶏もも', 'とりもも肉'],
+    '鶏むね肉': ['鶏むね', '鶏胸肉', 'とりむね肉'],
+    '豚肉': ['ぶた肉', 'ポーク'],
+    '豚バラ肉': ['豚バラ'],
+    '牛肉': ['ぎゅう肉', 'ビーフ'],
+    'ひき肉': ['挽肉', '挽き肉', 'ミンチ'],
+    '合いびき肉': ['合挽肉', '合い挽き肉', '合びき肉'],
+    'ベーコン': [],
+    'ウインナー': ['ウィンナー', 'ソーセージ'],
+    '鮭': ['さけ', 'しゃけ', 'サーモン'],
+    'さば': ['鯖'],
+    'ツナ': ['ツナ缶', 'シーチキン'],
+    'ご飯': ['ごはん', '白飯', '白米'],
+}
+
+
+def _build_fold_table():
+    # カタカナ（ァ〜ヶ）を対応するひらがなに、中黒は削除
+    table = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+    table[ord('・')] = None
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+@lru_cache(maxsize=4096)
+def ingredient_key(name):
+    """比較用のキー（NFKC・小文字化・カタカナ→ひらがな・空白と中黒を除去）"""
+    text = unicodedata.normalize('NFKC', name or '').lower().translate(_FOLD_TABLE)
+    return ''.join(text.split())
+
+
+def _build_synonym_table():
+    table = {}
+    for canonical, variants in INGREDIENT_SYNONYMS.items():
+        for variant in [canonical] + variants:
+            table[ingredient_key(variant)] = canonical
+    return table
+
+
+# キー → 代表表記
+_SYNONYM_TABLE = _build_synonym_table()
+
+# 代表表記 → その食材の全表記のキー（レシピタイトルに含まれるかの判定用）
+_VARIANT_KEYS = {
+    canonical: tuple(sorted({ingredient_key(variant) for variant in [canonical] + variants}, key=len, reverse=True))
+    for canonical, variants in INGREDIENT_SYNONYMS.items()
+}
+
+
+@lru_cache(maxsize=4096)
+def canonical_ingredient(name):
+    """検索に使う代表表記（辞書に無い名前はNFKC正規化・空白を整えたもの）"""
+    canonical = _SYNONYM_TABLE.get(ingredient_key(name))
+    if canonical:
+        return canonical
+    text = unicodedata.normalize('NFKC', name or '').lower()
+    return ' '.join(text.split())
+
+
+def unique_ingredient_names(names, limit=None):
+    """表記揺れをまとめた代表表記の一覧（最初に出てきた順、最大limit件）"""
+    seen = set()
+    result = []
+    for name in names:
+        canonical = canonical_ingredient(name)
+        key = ingredient_key(canonical)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        result.append(canonical)
+        if limit is not None and len(result) >= limit:
+            break
+    return result
+
+
+def ingredient_variant_keys(name):
+    """食材の全表記のキー（辞書に無い食材は自身のキーのみ）"""
+    canonical = canonical_ingredient(name)
+    return _VARIANT_KEYS.get(canonical) or (ingredient_key(canonical),)
+
+
+def mentions_ingredient(text, name):
+    """textに食材名（表記揺れを含む）が含まれるか"""
+    text_key = ingredient_key(text)
+    return any(variant in text_key for variant in ingredient_variant_keys(name))
@@ -0,0 +1,79 @@
+import os
+import json
+import base64
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+
+# ====================
+# キーセット（カーソル）方式のページ送り
+# ====================
+"""
+OFFSETで読み飛ばすと後ろのページほど遅くなり、途中で行が増減すると重複・抜けが出る。
+ここでは前のページの最後の行の並び替えキーをカーソルにして「それより後ろ」をLIMIT件だけ読む。
+・keys は (SQL式, 降順ならTrue) の並び。最後は一意な列（id）にして順序を確定させる
+・カーソルはキーの値のJSONをbase64にしたもの（中身を書き換えられてもuser_idの絞り込みは外れない）
+・NULLになり得る列はcoalesceなどでNULLにならない式にしてから渡す
+"""
+
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '30'))
+
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(expr, value):
+    # 日付はSQLiteのDate/DateTime型に渡せるようにPythonの型に戻す
+    python_type = expr.type.python_type
+    if value is not None and python_type in (date, datetime):
+        return python_type.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values):
+    data = json.dumps([_dump_value(value) for value in values], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """カーソルをキーの値に戻す（空・壊れている場合はNone = 先頭から）"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError('key count mismatch')
+        return [_load_value(expr, value) for (expr, _), value in zip(keys, values)]
+    except (ValueError, TypeError, NotImplementedError) as e:
+        print(f"[PAGINATION] Invalid cursor ignored: {e}")
+        return None
+
+
+def _after(keys, values):
+    # (k1, k2, ...) が values より後ろ：k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...（降順のキーは < ）
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        beyond = expr < values[i] if descending else expr > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_page(query, keys, cursor=None, limit=PAGE_SIZE):
+    """1ページ分の行と次のページのカーソル（最後のページならNone）を返す"""
+    values = decode_cursor(cursor, keys)
+    if values is not None:
+        query = query.filter(_after(keys, values))
+
+    order = [expr.desc() if descending else expr.asc() for expr, descending in keys]
+    # 次のページがあるかを知るために1件多く読む
+    rows = query.add_columns(*[expr for expr, _ in keys])\
+        .order_by(*order)\
+        .limit(limit + 1)\
+        .all()
+
+    next_cursor = encode_cursor(rows[limit - 1][1:]) if len(rows) > limit else None
+    return [row[0] for row in rows[:limit]], next_cursor
@@ -0,0 +1,138 @@
+import os
+from recipe_cache import normalize_query
+from normalizer import unique_ingredient_names, mentions_ingredient
+from functions import fetch_recipes_for_queries, iter_sources_as_completed, RECIPE_SOURCES
+
+
+# ====================
+# 複数食材の検索を食材ごとの検索に分けるクエリプランナー
+# ====================
+"""
+「卵 玉ねぎ」「玉ねぎ 卵」「タマネギ たまご」のような組み合わせをそのままサイトに投げると、
+並び順や組み合わせごとに別のキャッシュになりほとんどヒットしない。
+選択した食材は代表表記に揃えて重複排除し、食材ごとの検索に分け、キャッシュに無いものだけを取得する。
+自由入力の検索語は分割せず、そのまま1つの検索にする。
+結果は手元でまとめ、すべての語に当てはまるレシピだけを返す（1件も無いときだけ当てはまる語が多い順の和集合）。
+"""
+
+RECIPE_PLAN_MAX_TERMS = int(os.environ.get('RECIPE_PLAN_MAX_TERMS', '4'))  # サイトに問い合わせる語数の上限
+
+
+class QueryPlan:
+    """検索語の正規化結果
+
+    terms      ：選択順のまま重複排除した全検索語（食材は代表表記、自由入力は1語として最後）
+    subqueries ：実際にサイトへ問い合わせる語（選択順で最大RECIPE_PLAN_MAX_TERMS個に切ってから並べ替え、
+                 並び順によらず同じキャッシュキーになる）
+    canonical  ：subqueriesを空白でつないだもの（ログ・索引検索用）
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.subqueries = sorted(terms[:RECIPE_PLAN_MAX_TERMS])
+        self.canonical = ' '.join(self.subqueries)
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def __repr__(self):
+        return f"QueryPlan({self.canonical!r}, subqueries={self.subqueries})"
+
+
+def plan_search(selected_ingredients, query=''):
+    """選択した食材と自由入力の検索語から検索計画を作る
+
+    「タマネギ」「玉葱」などの表記揺れは代表表記（玉ねぎ）にまとめる。
+    自由入力は分割しない（1語ならその食材の代表表記にする）。
+    """
+    names = [name for name in map(normalize_query, selected_ingredients) if name]
+    terms = unique_ingredient_names(names)
+
+    free_text = normalize_query(query)
+    folded = unique_ingredient_names(free_text.split())
+    if not folded:
+        # 「・」など記号だけの入力は検索語にしない
+        free_text = ''
+    elif ' ' not in free_text:
+        free_text = folded[0]
+
+    if free_text:
+        # 自由入力は必ず問い合わせるよう、食材は選択順で1つ分空けて切る
+        limit = RECIPE_PLAN_MAX_TERMS - 1
+        terms = [term for term in terms if term != free_text]
+        terms = terms[:limit] + [free_text] + terms[limit:]
+    return QueryPlan(terms)
+
+
+def _mentions_term(title, term):
+    # 自由入力の複数語は、すべての語がタイトルに含まれるときだけ当てはまる
+    return all(mentions_ingredient(title, word) for word in term.split())
+
+
+def merge_results(plan, results_by_query, ranker=None):
+    """検索語ごとの結果をまとめ、すべての検索語に当てはまるレシピだけを返す
+
+    レシピが当てはまる語 ＝ そのレシピが見つかった検索語 ＋ タイトルに含まれる語（表記揺れを含む）。
+    問い合わせた語すべてに当てはまるレシピが無いときだけ、全レシピを当てはまる語の多い順に返す。
+    同じ語数なら、ranker（FridgeRanker）のスコア順、その次は検索語順・サイト内の順位の順。
+    """
+    merged = {}
+    for query in plan.subqueries:
+        for recipe in results_by_query.get(query, []):
+            entry = merged.get(recipe['url'])
+            if entry is None:
+                entry = merged[recipe['url']] = {'recipe': recipe, 'matched': set()}
+            entry['matched'].add(query)
+
+    for entry in merged.values():
+        title = entry['recipe'].get('title', '')
+        entry['matched'].update(term for term in plan.terms if _mentions_term(title, term))
+
+    entries = list(merged.values())
+    required = set(plan.subqueries)
+    matched_all = [entry for entry in entries if required <= entry['matched']]
+    if matched_all:
+        entries = matched_all
+    elif entries and len(required) > 1:
+        print(f"[PLAN] No recipe matches all of {plan.subqueries}, falling back to ranked union")
+
+    if ranker:
+        for entry, score in zip(entries, ranker.scores([entry['recipe'] for entry in entries])):
+            entry['score'] = score
+
+    ranked = sorted(entries, key=lambda entry: (-len(entry['matched']), -entry.get('score', 0.0)))
+    return [entry['recipe'] for entry in ranked]
+
+
+def run_plan(plan, total_deadline=None, source_deadlines=None, ranker=None):
+    """検索計画を実行する（fetch_all_recipes と同じ形で返す）"""
+    if not plan:
+        return {'recipes': [], 'counts': {}, 'timed_out': []}
+
+    fetched = fetch_recipes_for_queries(plan.subqueries, total_deadline, source_deadlines)
+
+    by_query = {query: result['recipes'] for query, result in fetched.items()}
+    recipes = merge_results(plan, by_query, ranker)
+
+    timed_out = []
+    for result in fetched.values():
+        timed_out.extend(name for name in result['timed_out'] if name not in timed_out)
+
+    counts = {}
+    for name, _ in RECIPE_SOURCES:
+        if name not in timed_out:
+            counts[name] = sum(1 for recipe in recipes if recipe.get('source') == name)
+
+    print(f"[PLAN] {plan} -> {len(recipes)} recipes")
+    return {'recipes': recipes, 'counts': counts, 'timed_out': timed_out}
+
+
+def iter_plan_as_completed(plan, total_deadline=None, source_deadlines=None, ranker=None):
+    """検索計画をサイトごとに実行し、終わったサイトから順にまとめた結果を返すジェネレータ
+
+    (サイト名, レシピ一覧, 状態) を返す。状態は 'ok' または 'timeout'。
+    """
+    if not plan:
+        return
+    for name, site_results, status in iter_sources_as_completed(plan.subqueries, total_deadline, source_deadlines):
+        yield name, merge_results(plan, site_results, ranker), status
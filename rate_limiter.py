@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import threading
+from functools import wraps
+
+
+# ====================
+# レシピサイトへのリクエスト数制限（ホストごとのトークンバケット）
+# ====================
+"""
+バケットの状態は instance/rate_limit.db（SQLite）に保存し、全ワーカープロセスで共有する。
+トークンが無い場合は最大 RATE_LIMIT_MAX_WAIT 秒だけ待ち、それでも取れなければ
+RateLimitedError を送出する（キャッシュ層が古い結果にフォールバックする）。
+"""
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', '2'))  # 1秒あたりに補充するトークン数
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '6'))  # バケットの容量
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '1.5'))  # トークンを待つ最大秒数
+
+# ホストごとの設定（未指定のホストは上の既定値を使用）
+RATE_LIMITS = {
+    # 'recipe.rakuten.co.jp': {'rate': 1, 'burst': 3},
+}
+
+
+class RateLimitedError(Exception):
+    """トークンが取得できなかった"""
+
+
+class SQLiteTokenBucket:
+    """SQLiteに状態を置く、プロセス間で共有できるトークンバケット"""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def path(self):
+        if self._path is None:
+            # config → functions → rate_limiter の循環importを避けるため遅延import
+            from config import instance_dir
+            self._path = os.path.join(instance_dir, 'rate_limit.db')
+        return self._path
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS token_bucket (
+                    host TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def _take(self, host, rate, burst):
+        """トークンを1つ取る。取れなければ次のトークンまでの秒数を返す"""
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE で他プロセスの読み書きと直列化する
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM token_bucket WHERE host = ?', (host,)).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO token_bucket (host, tokens, updated_at) VALUES (?, ?, ?)',
+                (host, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, host, max_wait=RATE_LIMIT_MAX_WAIT):
+        """トークンを取得する（最大max_wait秒待つ）。取得できればTrue"""
+        limits = RATE_LIMITS.get(host, {})
+        rate = limits.get('rate', RATE_LIMIT_RATE)
+        burst = limits.get('burst', RATE_LIMIT_BURST)
+
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            wait = self._take(host, rate, burst)
+            if wait == 0:
+                self._record(host, 'waited' if waited else 'granted')
+                return True
+
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                self._record(host, 'rejected')
+                return False
+            waited = True
+            time.sleep(wait)
+
+    def _record(self, host, key):
+        with self._lock:
+            stats = self._stats.setdefault(host, {'granted': 0, 'waited': 0, 'rejected': 0})
+            stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return {host: dict(stats) for host, stats in self._stats.items()}
+
+
+token_bucket = SQLiteTokenBucket()
+
+
+def rate_limited(host):
+    """fetch関数を呼ぶ前にホストのトークンを取得するデコレータ"""
+    def decorator(fetcher):
+        @wraps(fetcher)
+        def wrapper(query):
+            if RATE_LIMIT_ENABLED:
+                try:
+                    acquired = token_bucket.acquire(host)
+                except sqlite3.Error as e:
+                    # 状態の保存先が使えない場合は制限せずに続行する
+                    print(f"[RATE_LIMIT ERROR] {host}: {e}")
+                    acquired = True
+                if not acquired:
+                    raise RateLimitedError(f"{host} rate limit exceeded")
+            return fetcher(query)
+        return wrapper
+    return decorator
+
+
+def get_rate_limit_stats():
+    """ホストごとの許可・待機・拒否の回数を返す"""
+    return token_bucket.stats()
@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from rate_limiter import RateLimitedError
+
+
+# ====================
+# レシピ検索結果のメモリキャッシュ（TTL + LRU）
+# ====================
+"""
+キー：(サイト名, 正規化した検索語)
+・TTL内  → そのまま返す（fresh）
+・TTLを過ぎてもSTALE期間内 → 古い結果をすぐ返し、裏で取り直す（stale-while-revalidate）
+・それ以外 → 取得して保存する（miss）
+件数とバイト数の上限を超えたら、最後に使われたのが古いものから削除する。
+メモリに無い場合は instance/recipe_cache.db（SQLite）を参照するため、
+ワーカー間・再起動後（デスクトップ版の起動ごとも含む）でも同じキャッシュを使える。
+"""
+
+RECIPE_CACHE_MAX_ENTRIES = int(os.environ.get('RECIPE_CACHE_MAX_ENTRIES', '2000'))
+RECIPE_CACHE_MAX_BYTES = int(os.environ.get('RECIPE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RECIPE_CACHE_TTL = int(os.environ.get('RECIPE_CACHE_TTL', '1800'))  # 秒
+RECIPE_CACHE_STALE = int(os.environ.get('RECIPE_CACHE_STALE', '3600'))  # TTL後にstaleとして返せる秒数
+RECIPE_CACHE_NEGATIVE_TTL = int(os.environ.get('RECIPE_CACHE_NEGATIVE_TTL', '60'))  # 0件の結果を保持する秒数
+
+# 永続キャッシュ（instance/recipe_cache.db、全ワーカー・再起動後も共有）
+RECIPE_CACHE_PERSIST = os.environ.get('RECIPE_CACHE_PERSIST', 'True').lower() == 'true'
+RECIPE_CACHE_DB_MAX_BYTES = int(os.environ.get('RECIPE_CACHE_DB_MAX_BYTES', str(64 * 1024 * 1024)))
+RECIPE_CACHE_COMPACT_EVERY = int(os.environ.get('RECIPE_CACHE_COMPACT_EVERY', '200'))  # 書き込み何回ごとに整理するか
+# 読み込みのたびに最終アクセス日時を書き込まないよう、前回の記録からこの秒数が経ったときだけ更新する
+RECIPE_CACHE_ACCESS_INTERVAL = int(os.environ.get('RECIPE_CACHE_ACCESS_INTERVAL', '300'))
+
+
+def normalize_query(query):
+    """キャッシュキー用に検索語を正規化（全角/半角・大文字/小文字・空白の揺れを吸収）"""
+    query = unicodedata.normalize('NFKC', query or '').lower()
+    return ' '.join(query.split())
+
+
+def _copy_recipes(recipes):
+    # 呼び出し側でdictを書き換えてもキャッシュが壊れないようにコピーして返す
+    return [dict(recipe) for recipe in recipes]
+
+
+def _serialize(recipes):
+    # 区切りの空白を省いたJSONをzlibで圧縮して保存する
+    return zlib.compress(json.dumps(recipes, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _deserialize(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+class SQLiteRecipeStore:
+    """プロセスをまたいで共有する永続キャッシュ（SQLite）"""
+
+    def __init__(self, path=None, max_bytes=RECIPE_CACHE_DB_MAX_BYTES, compact_every=RECIPE_CACHE_COMPACT_EVERY,
+                 access_interval=RECIPE_CACHE_ACCESS_INTERVAL):
+        self._path = path
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self.access_interval = access_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is None:
+            # config → functions → recipe_cache の循環importを避けるため遅延import
+            from config import instance_dir
+            self._path = os.path.join(instance_dir, 'recipe_cache.db')
+        return self._path
+
+    def _connect(self):
+        # sqlite3の接続はスレッドをまたげないため、スレッドごとに保持する
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recipe_cache (
+                    source TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stale_until REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (source, query)
+                ) WITHOUT ROWID
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_recipe_cache_accessed_at ON recipe_cache (accessed_at)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, source, query, allow_expired=False):
+        """(recipes, expires_at, stale_until) を返す。無ければNone
+
+        allow_expired=True の場合は、掃除前であればstale期間を過ぎた行も返す。
+        最終アクセス日時（容量超過時の削除順）は、前回からaccess_interval秒以上経ったときだけ書き込む。
+        """
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT payload, expires_at, stale_until, accessed_at FROM recipe_cache WHERE source = ? AND query = ?',
+            (source, query)
+        ).fetchone()
+        if row is None or (row[2] < now and not allow_expired):
+            return None
+        if now - row[3] >= self.access_interval:
+            conn.execute(
+                'UPDATE recipe_cache SET accessed_at = ? WHERE source = ? AND query = ?',
+                (now, source, query)
+            )
+            conn.commit()
+        return _deserialize(row[0]), row[1], row[2]
+
+    def set(self, source, query, recipes, ttl, stale_seconds):
+        now = time.time()
+        payload = _serialize(recipes)
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO recipe_cache '
+            '(source, query, payload, size, expires_at, stale_until, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (source, query, payload, len(payload), now + ttl, now + ttl + stale_seconds, now)
+        )
+        conn.commit()
+
+        with self._lock:
+            self._writes += 1
+            should_compact = self._writes % self.compact_every == 0
+        if should_compact:
+            self.compact()
+
+    def compact(self):
+        """期限切れを削除し、合計サイズが上限を超えた分を古い順に削除する"""
+        conn = self._connect()
+        expired = conn.execute('DELETE FROM recipe_cache WHERE stale_until < ?', (time.time(),)).rowcount
+        evicted = conn.execute("""
+            DELETE FROM recipe_cache WHERE (source, query) IN (
+                SELECT source, query FROM (
+                    SELECT source, query,
+                           SUM(size) OVER (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING) AS total
+                    FROM recipe_cache
+                ) WHERE total > ?
+            )
+        """, (self.max_bytes,)).rowcount
+        conn.commit()
+        print(f"[CACHE] Compacted persistent cache: expired={expired}, evicted={evicted}")
+
+    def stats(self):
+        row = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recipe_cache').fetchone()
+        return {'entries': row[0], 'bytes': row[1]}
+
+
+class RecipeCache:
+    """スレッドセーフなTTL + LRUキャッシュ"""
+
+    def __init__(self, max_entries=RECIPE_CACHE_MAX_ENTRIES, max_bytes=RECIPE_CACHE_MAX_BYTES,
+                 stale_seconds=RECIPE_CACHE_STALE, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self.store = store  # メモリに無い場合に参照する永続キャッシュ
+        self._entries = OrderedDict()  # key -> (recipes, size, fresh_until, stale_until)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='recipe-cache-refresh')
+        self._stats = {'hits': 0, 'stale_hits': 0, 'persistent_hits': 0, 'misses': 0,
+                       'expired_hits': 0, 'evictions': 0, 'refreshes': 0}
+
+    def get(self, source, query):
+        """(recipes, 状態) を返す。状態は 'fresh' / 'stale' / None"""
+        key = (source, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now > entry[3]:
+                self._remove(key)
+                entry = None
+
+            if entry is not None:
+                recipes, size, fresh_until, stale_until = entry
+                self._entries.move_to_end(key)
+                if now <= fresh_until:
+                    self._stats['hits'] += 1
+                    return _copy_recipes(recipes), 'fresh'
+                self._stats['stale_hits'] += 1
+                return _copy_recipes(recipes), 'stale'
+
+        # メモリに無ければ永続キャッシュを確認し、見つかればメモリにも載せる
+        stored = self._get_from_store(key)
+        with self._lock:
+            if stored is None:
+                self._stats['misses'] += 1
+                return None, None
+            self._stats['persistent_hits'] += 1
+
+        recipes, expires_at, stale_until = stored
+        remaining = expires_at - time.time()
+        self._set_memory(key, recipes, remaining, max(0, stale_until - max(expires_at, time.time())))
+        return _copy_recipes(recipes), ('fresh' if remaining > 0 else 'stale')
+
+    def _get_from_store(self, key):
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(*key)
+        except Exception as e:
+            print(f"[CACHE ERROR] Persistent cache read failed: {e}")
+            return None
+
+    def get_expired(self, source, query):
+        """期限に関係なく永続キャッシュに残っている結果を返す（レート制限時のフォールバック用）"""
+        if self.store is None:
+            return None
+        try:
+            stored = self.store.get(source, normalize_query(query), allow_expired=True)
+        except Exception as e:
+            print(f"[CACHE ERROR] Persistent cache read failed: {e}")
+            return None
+        if stored is None:
+            return None
+        with self._lock:
+            self._stats['expired_hits'] += 1
+        return stored[0]
+
+    def set(self, source, query, recipes, ttl=RECIPE_CACHE_TTL):
+        key = (source, normalize_query(query))
+        stale_seconds = self.stale_seconds
+        if not recipes:
+            # 0件（一時的な失敗の可能性がある）はTTLもstale期間も短くし、1時間古い0件を返し続けないようにする
+            ttl = min(ttl, RECIPE_CACHE_NEGATIVE_TTL)
+            stale_seconds = min(stale_seconds, ttl)
+        self._set_memory(key, recipes, ttl, stale_seconds)
+
+        # 0件の結果は短命なので永続化しない
+        if self.store is not None and recipes:
+            try:
+                self.store.set(*key, recipes, ttl, self.stale_seconds)
+            except Exception as e:
+                print(f"[CACHE ERROR] Persistent cache write failed: {e}")
+
+    def _set_memory(self, key, recipes, ttl, stale_seconds):
+        size = len(json.dumps(recipes, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        now = time.monotonic()
+        entry = (_copy_recipes(recipes), size, now + ttl, now + max(ttl, 0) + stale_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            # LRU：件数・バイト数の上限に収まるまで古いものから削除
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1]
+
+    def refresh_in_background(self, source, query, loader, ttl):
+        """同じキーの再取得が重ならないようにして裏で取り直す"""
+        key = (source, normalize_query(query))
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+
+        def refresh():
+            try:
+                self.set(source, query, loader(query), ttl)
+            except Exception as e:
+                print(f"[CACHE ERROR] Refresh failed for {source} '{query}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        if self.store is not None:
+            try:
+                stats['persistent'] = self.store.stats()
+            except Exception as e:
+                stats['persistent'] = {'error': str(e)}
+        return stats
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の取得にまとめる（後から来た呼び出しは結果のコピーを受け取る）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+            else:
+                self._stats['shared'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return _copy_recipes(call.result)
+
+        try:
+            result = fn()
+            # 呼び出し側が書き換えても待っている呼び出しに影響しないよう、共有するのは別のコピーにする
+            call.result = _copy_recipes(result)
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+# プロセス全体で共有するキャッシュ
+recipe_cache = RecipeCache(store=SQLiteRecipeStore() if RECIPE_CACHE_PERSIST else None)
+recipe_flight = SingleFlight()
+
+
+def cached_recipes(source, ttl=RECIPE_CACHE_TTL):
+    """fetch_*_recipes にキャッシュをかぶせるデコレータ"""
+    def decorator(fetcher):
+        @wraps(fetcher)
+        def wrapper(query):
+            recipes, state = recipe_cache.get(source, query)
+            if state == 'fresh':
+                return recipes
+            if state == 'stale':
+                recipe_cache.refresh_in_background(source, query, fetcher, ttl)
+                return recipes
+
+            try:
+                recipes = fetcher(query)
+            except RateLimitedError as e:
+                # レート制限中は期限切れでも残っている結果を返す（無ければ空）
+                print(f"[RATE_LIMIT] {source}: {e}")
+                return recipe_cache.get_expired(source, query) or []
+            except Exception as e:
+                # 取得失敗（サーキットopenを含む）は空の結果として扱い、キャッシュしない
+                print(f"[ERROR] {source} fetch error: {e}")
+                return []
+            recipe_cache.set(source, query, recipes, ttl)
+            return _copy_recipes(recipes)
+        return wrapper
+    return decorator
+
+
+def single_flight(source):
+    """同じ (サイト名, 正規化した検索語) の同時取得を1回にまとめるデコレータ"""
+    def decorator(fetcher):
+        @wraps(fetcher)
+        def wrapper(query):
+            return recipe_flight.do((source, normalize_query(query)), lambda: fetcher(query))
+        return wrapper
+    return decorator
+
+
+def get_cache_stats():
+    """キャッシュのヒット/ミス/削除数などを返す"""
+    return dict(recipe_cache.stats(), single_flight=recipe_flight.stats())
@@ -0,0 +1,76 @@
+import hashlib
+import unicodedata
+import urllib.parse
+from normalizer import ingredient_key
+
+
+# ====================
+# レシピの重複排除（URLとタイトルの指紋）
+# ====================
+"""
+同じレシピが複数のサイトから、または同じサイトからトラッキング用パラメータ違いで返ってくることがある。
+・URLは正規化（https・ホスト小文字・フラグメントと計測用パラメータの除去・末尾の/の除去）して比較する
+  （正規化したURLは比較にだけ使い、recipe['url']はサイトが返したまま残す）
+・タイトルは表記揺れ・記号・空白を除いてからハッシュにした指紋で比較する
+どちらかが既出ならそのレシピは捨てる（先に出てきたものを残す）。
+"""
+
+# 計測・流入元の記録用で、ページの内容には関係しないクエリパラメータ
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'yclid', 'msclkid', 'ref', 'ref_src', 'from', 'source',
+    'l-id', 'rafcid', 's_kwcid', 'scid', 'sc_e', 'ito',
+}
+TRACKING_PREFIXES = ('utm_', 'rf_')
+
+
+def canonical_url(url):
+    """比較用に正規化したURL"""
+    parts = urllib.parse.urlsplit((url or '').strip())
+    if not parts.netloc:
+        return url or ''
+
+    query = [
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    path = parts.path.rstrip('/') or '/'
+    scheme = 'https' if parts.scheme in ('http', 'https') else parts.scheme
+    return urllib.parse.urlunsplit((scheme, parts.netloc.lower(), path, urllib.parse.urlencode(sorted(query)), ''))
+
+
+def title_fingerprint(title):
+    """タイトルの指紋（表記揺れ・記号・空白を除いて8バイトのハッシュにしたもの）"""
+    key = ingredient_key(title)
+    # 文字・数字以外（【】！♪や絵文字など）は除く
+    text = ''.join(ch for ch in key if unicodedata.category(ch)[0] in 'LN')
+    if not text:
+        return None
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+
+class RecipeDeduper:
+    """出てきたURLとタイトルの指紋を覚えておき、重複を判定する"""
+
+    def __init__(self):
+        self._urls = set()
+        self._titles = set()
+
+    def add(self, recipe):
+        """初めて出てきたレシピならTrue"""
+        url = canonical_url(recipe.get('url'))
+        fingerprint = title_fingerprint(recipe.get('title'))
+        if url in self._urls or (fingerprint is not None and fingerprint in self._titles):
+            return False
+
+        self._urls.add(url)
+        if fingerprint is not None:
+            self._titles.add(fingerprint)
+        return True
+
+    def filter(self, recipes):
+        return [recipe for recipe in recipes if self.add(recipe)]
+
+
+def dedupe_recipes(recipes):
+    """重複したレシピを除く（順序は保つ）"""
+    return RecipeDeduper().filter(recipes)
@@ -0,0 +1,214 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from recipe_cache import normalize_query
+
+
+# ====================
+# 取得したレシピの全文検索インデックス（SQLite FTS5）
+# ====================
+"""
+各サイトから取得したレシピを instance/recipe_index.db に蓄積し、
+タイトル・サイト名・URL・画像と、そのレシピが見つかった検索語で検索できるようにする。
+日本語のタイトルは分かち書きしないため、1文字と2文字（バイグラム）に分けて索引を作る。
+検索は索引で候補を絞ってから、正規化したタイトル・検索語に各語が含まれるかで確認する。
+"""
+
+RECIPE_INDEX_ENABLED = os.environ.get('RECIPE_INDEX_ENABLED', 'True').lower() == 'true'
+RECIPE_INDEX_LIMIT = int(os.environ.get('RECIPE_INDEX_LIMIT', '45'))  # 1回の検索で返す最大件数
+RECIPE_INDEX_MAX_TERMS = 20  # 1レシピに保存する検索語の最大数
+
+# 英数字の連続はそのまま1語、それ以外（かな・漢字など）は1文字ずつに分ける
+_WORD_RE = re.compile(r'[0-9a-z]+|[^\W_]', re.UNICODE)
+
+
+def _grams(text):
+    """索引用のトークン列（英数字の単語、日本語の1文字とバイグラム）"""
+    tokens = []
+    for chunk in normalize_query(text).split():
+        chars = _WORD_RE.findall(chunk)
+        tokens.extend(chars)
+        tokens.extend(a + b for a, b in zip(chars, chars[1:]) if len(a) == 1 and len(b) == 1)
+    return ' '.join(tokens)
+
+
+def _match_expression(words):
+    """検索語からFTS5のMATCH式を作る（各語のバイグラムをすべて含むもの）"""
+    clauses = []
+    for word in words:
+        chars = _WORD_RE.findall(word)
+        tokens = [a + b for a, b in zip(chars, chars[1:]) if len(a) == 1 and len(b) == 1]
+        tokens += [c for c in chars if len(c) > 1]
+        if not tokens:
+            tokens = chars
+        clauses.extend('"' + token.replace('"', '""') + '"' for token in tokens)
+    return ' AND '.join(clauses)
+
+
+class RecipeIndex:
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'indexed': 0, 'searches': 0, 'hits': 0}
+
+    @property
+    def path(self):
+        if self._path is None:
+            # config → functions → recipe_index の循環importを避けるため遅延import
+            from config import instance_dir
+            self._path = os.path.join(instance_dir, 'recipe_index.db')
+        return self._path
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recipe_doc (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    img TEXT,
+                    norm_title TEXT NOT NULL,
+                    terms TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # rowid = recipe_doc.id。タイトルと検索語を別の列にして、タイトルの一致を重く数える
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5(
+                    title_grams, term_grams, tokenize = 'unicode61 remove_diacritics 0'
+                )
+            """)
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def add(self, source, query, recipes):
+        """取得したレシピを索引に追加・更新する"""
+        term = normalize_query(query)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            for recipe in recipes:
+                url = recipe.get('url')
+                title = recipe.get('title')
+                if not url or not title:
+                    continue
+
+                row = conn.execute('SELECT id, terms FROM recipe_doc WHERE url = ?', (url,)).fetchone()
+                terms = row[1].split('\n') if row else []
+                if term and term not in terms:
+                    terms = (terms + [term])[-RECIPE_INDEX_MAX_TERMS:]
+                terms_text = '\n'.join(terms)
+
+                values = (title, recipe.get('source') or source, recipe.get('img') or '',
+                          normalize_query(title), terms_text, now)
+                if row:
+                    doc_id = row[0]
+                    conn.execute(
+                        'UPDATE recipe_doc SET title = ?, source = ?, img = ?, norm_title = ?, terms = ?, updated_at = ? '
+                        'WHERE id = ?', values + (doc_id,)
+                    )
+                    conn.execute('DELETE FROM recipe_fts WHERE rowid = ?', (doc_id,))
+                else:
+                    doc_id = conn.execute(
+                        'INSERT INTO recipe_doc (title, source, img, norm_title, terms, updated_at, url) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)', values + (url,)
+                    ).lastrowid
+                conn.execute(
+                    'INSERT INTO recipe_fts (rowid, title_grams, term_grams) VALUES (?, ?, ?)',
+                    (doc_id, _grams(title), _grams(' '.join(terms)))
+                )
+
+        with self._lock:
+            self._stats['indexed'] += len(recipes)
+
+    def search(self, query, sources=None, limit=RECIPE_INDEX_LIMIT):
+        """索引から検索する（タイトルでの一致を優先し、新しく取得したものから）"""
+        words = normalize_query(query).split()
+        expression = _match_expression(words)
+        if not expression:
+            return []
+
+        sql = ('SELECT d.title, d.url, d.img, d.source, d.norm_title, d.terms '
+               'FROM recipe_fts f JOIN recipe_doc d ON d.id = f.rowid '
+               'WHERE recipe_fts MATCH ?')
+        params = [expression]
+        if sources:
+            sql += ' AND d.source IN (%s)' % ','.join('?' * len(sources))
+            params.extend(sources)
+        # 1文字・2文字の組み合わせは誤一致があるため、多めに取ってから確認する
+        sql += ' ORDER BY bm25(recipe_fts, 4.0, 1.0), d.updated_at DESC LIMIT ?'
+        params.append(limit * 3)
+
+        results = []
+        for title, url, img, source, norm_title, terms in self._connect().execute(sql, params):
+            haystack = norm_title + '\n' + terms
+            if all(word in haystack for word in words):
+                results.append({'title': title, 'url': url, 'img': img, 'source': source})
+                if len(results) >= limit:
+                    break
+
+        with self._lock:
+            self._stats['searches'] += 1
+            self._stats['hits'] += 1 if results else 0
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats['documents'] = self._connect().execute('SELECT COUNT(*) FROM recipe_doc').fetchone()[0]
+        except Exception as e:
+            print(f"[INDEX ERROR] Stats failed: {e}")
+        return stats
+
+
+recipe_index = RecipeIndex()
+
+# 索引への書き込みは1スレッドにまとめ、検索リクエストを待たせない
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recipe-index')
+
+
+def indexed_recipes(source):
+    """fetch関数が取得したレシピを裏で索引に追加するデコレータ"""
+    def decorator(fetcher):
+        @wraps(fetcher)
+        def wrapper(query):
+            recipes = fetcher(query)
+            if RECIPE_INDEX_ENABLED and recipes:
+                _index_executor.submit(_add_to_index, source, query, [dict(recipe) for recipe in recipes])
+            return recipes
+        return wrapper
+    return decorator
+
+
+def _add_to_index(source, query, recipes):
+    try:
+        recipe_index.add(source, query, recipes)
+    except Exception as e:
+        print(f"[INDEX ERROR] Indexing {source} '{query}' failed: {e}")
+
+
+def search_recipe_index(query, sources=None, limit=RECIPE_INDEX_LIMIT):
+    """索引から検索する（失敗時は空リスト）"""
+    if not RECIPE_INDEX_ENABLED:
+        return []
+    try:
+        return recipe_index.search(query, sources=sources, limit=limit)
+    except Exception as e:
+        print(f"[INDEX ERROR] Search '{query}' failed: {e}")
+        return []
+
+
+def get_index_stats():
+    return recipe_index.stats()
@@ -0,0 +1,108 @@
+import os
+from datetime import date
+from models import db, Ingredient
+from normalizer import canonical_ingredient, ingredient_key, ingredient_variant_keys
+
+
+# ====================
+# 冷蔵庫の中身に合わせたレシピの並べ替え
+# ====================
+"""
+レシピのタイトルに冷蔵庫の食材（表記揺れを含む）が含まれるほど、
+またその食材の賞味期限が近いほど高いスコアをつける。
+候補レシピのタイトルから「文字バイグラム → レシピ」の転置インデックスを作り、
+食材ごとにバイグラムの共通部分で候補を絞ってから部分一致を確認するため、
+レシピ数千件 × 食材数百件でも全組み合わせを比較せずに済む。
+"""
+
+RANKING_EXPIRED_WEIGHT = float(os.environ.get('RANKING_EXPIRED_WEIGHT', '3.0'))  # 期限切れ・当日
+RANKING_BASE_WEIGHT = float(os.environ.get('RANKING_BASE_WEIGHT', '1.0'))  # 期限が先・未設定
+RANKING_HORIZON_DAYS = int(os.environ.get('RANKING_HORIZON_DAYS', '7'))  # この日数より先は基本の重み
+
+
+def expiry_weight(days_left):
+    """期限までの日数から食材の重みを決める（近いほど重い）"""
+    if days_left is None or days_left >= RANKING_HORIZON_DAYS:
+        return RANKING_BASE_WEIGHT
+    if days_left <= 0:
+        return RANKING_EXPIRED_WEIGHT
+    ratio = 1 - days_left / RANKING_HORIZON_DAYS
+    return RANKING_BASE_WEIGHT + (RANKING_EXPIRED_WEIGHT - RANKING_BASE_WEIGHT) * ratio
+
+
+def _grams(key):
+    # 1文字のキーはその文字、それ以外はバイグラム
+    if len(key) < 2:
+        return [key] if key else []
+    return [key[i:i + 2] for i in range(len(key) - 1)]
+
+
+class FridgeRanker:
+    """冷蔵庫の食材からレシピのスコアを計算する"""
+
+    def __init__(self, items, today=None):
+        """items は (食材名, 賞味期限) の並び"""
+        today = today or date.today()
+        weights = {}  # 代表表記 -> 重み（同じ食材が複数あれば一番期限が近いもの）
+        for name, expiry_date in items:
+            canonical = canonical_ingredient(name)
+            if not canonical:
+                continue
+            days_left = (expiry_date - today).days if expiry_date else None
+            weights[canonical] = max(weights.get(canonical, 0.0), expiry_weight(days_left))
+
+        # 食材ごとに (全表記のキーとそのバイグラム, 重み)
+        self.terms = [
+            ([(variant, _grams(variant)) for variant in ingredient_variant_keys(canonical)], weight)
+            for canonical, weight in weights.items()
+        ]
+        # 食材側に出てくるバイグラムだけを索引に載せる
+        self._needed = {gram for variants, _ in self.terms for _, grams in variants for gram in grams}
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def scores(self, recipes):
+        """各レシピのスコアをrecipesと同じ順で返す"""
+        keys = [ingredient_key(recipe.get('title', '')) for recipe in recipes]
+
+        # 転置インデックス：バイグラム（と1文字） → タイトルにそれを含むレシピの番号
+        postings = {}
+        needed = self._needed
+        for i, key in enumerate(keys):
+            hits = needed.intersection(_grams(key))
+            hits.update(needed.intersection(key))
+            for gram in hits:
+                postings.setdefault(gram, set()).add(i)
+
+        scores = [0.0] * len(recipes)
+        for variants, weight in self.terms:
+            matched = set()
+            for variant, grams in variants:
+                if not grams:
+                    continue
+                # 件数の少ないポスティングから共通部分を取る
+                lists = sorted((postings.get(gram, set()) for gram in set(grams)), key=len)
+                candidates = set(lists[0])
+                for posting in lists[1:]:
+                    if not candidates:
+                        break
+                    candidates &= posting
+                matched.update(i for i in candidates if variant in keys[i])
+            for i in matched:
+                scores[i] += weight
+        return scores
+
+    def rank(self, recipes):
+        """スコアの高い順に並べ替える（同点は元の順）"""
+        if not self.terms:
+            return list(recipes)
+        scores = self.scores(recipes)
+        order = sorted(range(len(recipes)), key=lambda i: -scores[i])
+        return [recipes[i] for i in order]
+
+
+def load_fridge_ranker(user_id):
+    """ユーザーの冷蔵庫の中身からランキングを作る（名前と期限だけを読む）"""
+    items = db.session.query(Ingredient.name, Ingredient.expiry_date).filter_by(user_id=user_id).all()
+    return FridgeRanker(items)
@@ -0,0 +1,158 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from models import db, RecipeRecommendation
+from functions import get_expiry_notifications, fetch_recipes_for_queries
+from normalizer import unique_ingredient_names
+from recipe_ranking import load_fridge_ranker
+from recipe_dedup import RecipeDeduper
+
+
+# ====================
+# ダッシュボードのおすすめレシピ（リクエスト外で事前計算）
+# ====================
+"""
+期限切れ・3日以内の食材からおすすめレシピをバックグラウンドで計算して保存し、
+ダッシュボードは保存済みのものを読むだけにする。
+食材の追加・削除時や、日付が変わって対象の食材が変わったときに再計算する。
+"""
+
+RECOMMENDATION_MAX_AGE = timedelta(seconds=int(os.environ.get('RECOMMENDATION_MAX_AGE', '10800')))  # 3時間
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='recommendation')
+_pending = set()
+_dirty = set()  # 再計算中に食材が変わったユーザー（終わったらもう一度計算する）
+_pending_lock = threading.Lock()
+
+
+def select_recommendation_ingredients(notifications):
+    """おすすめの計算に使う食材名（期限切れ＋3日以内から最大3つ、表記揺れをまとめて重複排除）"""
+    priority_ingredients = notifications.get('expired', []) + notifications.get('expiring_soon', [])
+    return sorted(unique_ingredient_names([ing.name for ing in priority_ingredients], limit=3))
+
+
+def _selection_key(names):
+    # 計算に使った食材の組み合わせ（RecipeRecommendation.ingredient_keyに保存して変化を検出する）
+    return '\n'.join(names)
+
+
+def build_recommendations(user_id):
+    """おすすめレシピを計算する（(recipes, ingredient_key) を返す）"""
+    notifications = get_expiry_notifications(user_id)
+    selected_ingredients = select_recommendation_ingredients(notifications)
+    if not selected_ingredients:
+        return [], ''
+
+    # 各食材 × 各レシピサイトを並列に検索
+    print(f"[RECIPE_FETCH] Searching recipes for: {selected_ingredients}")
+    fetched = fetch_recipes_for_queries(selected_ingredients)
+
+    # 冷蔵庫の中身（期限が近い食材ほど重く）でスコアをつけて上位を選ぶ
+    ranker = load_fridge_ranker(user_id)
+
+    # 複数サイト・複数の食材で重複したレシピは1件にまとめる
+    deduper = RecipeDeduper()
+
+    all_recipes = []
+    for ingredient_name in selected_ingredients:
+        site_recipes = fetched[ingredient_name]['recipes']
+
+        # 各食材につき最大2つのレシピを選択
+        selected = []
+        for recipe in ranker.rank(site_recipes):
+            if deduper.add(recipe):
+                selected.append(recipe)
+                if len(selected) >= 2:
+                    break
+        for recipe in selected:
+            recipe['ingredient_used'] = ingredient_name  # どの食材で検索したかを記録
+        all_recipes.extend(selected)
+
+    # 全レシピから上位3つを選択
+    recommended_recipes = ranker.rank(all_recipes)[:3]
+    print(f"[RECIPE_RECOMMEND] Selected {len(recommended_recipes)} recipes for user {user_id}")
+    return recommended_recipes, _selection_key(selected_ingredients)
+
+
+def refresh_recommendations(user_id):
+    """おすすめレシピを計算して保存する（アプリケーションコンテキスト内で呼ぶこと）"""
+    recipes, key = build_recommendations(user_id)
+
+    # 別スレッド・別ワーカーが同時に初回保存した場合は、その行を更新し直す
+    for attempt in range(2):
+        try:
+            recommendation = RecipeRecommendation.query.filter_by(user_id=user_id).first()
+            if recommendation is None:
+                recommendation = RecipeRecommendation(user_id=user_id)
+                db.session.add(recommendation)
+            recommendation.recipes = json.dumps(recipes, ensure_ascii=False)
+            recommendation.ingredient_key = key
+            recommendation.updated_at = datetime.utcnow()
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Saving recommendations failed for user {user_id}: {e}")
+            break
+
+    return recipes
+
+
+def schedule_recommendation_refresh(user_id):
+    """おすすめレシピの再計算をバックグラウンドで予約する
+
+    同じユーザーの再計算が実行中なら重ねて実行せず、終わった後にもう一度だけ計算する
+    （実行中に変わった食材が反映されないままにならないように）。
+    """
+    with _pending_lock:
+        if user_id in _pending:
+            _dirty.add(user_id)
+            return
+        _pending.add(user_id)
+
+    app = current_app._get_current_object()
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    refresh_recommendations(user_id)
+            except Exception as e:
+                print(f"[ERROR] Recommendation refresh failed for user {user_id}: {e}")
+            with _pending_lock:
+                if user_id not in _dirty:
+                    _pending.discard(user_id)
+                    return
+                _dirty.discard(user_id)
+
+    _executor.submit(run)
+
+
+def get_stored_recommendations(user_id, notifications):
+    """保存済みのおすすめレシピを返す
+
+    古い・対象の食材が変わった場合は再計算を予約する。
+    戻り値は (recipes, updated_at)。未計算の場合は ([], None)。
+    """
+    recommendation = RecipeRecommendation.query.filter_by(user_id=user_id).first()
+    key = _selection_key(select_recommendation_ingredients(notifications))
+
+    # 未計算の場合は呼び出し側で計算する
+    if recommendation is None:
+        return [], None
+
+    if (recommendation.ingredient_key != key
+            or datetime.utcnow() - recommendation.updated_at > RECOMMENDATION_MAX_AGE):
+        schedule_recommendation_refresh(user_id)
+
+    # 対象の食材が無くなった場合は古いおすすめを表示しない
+    if not key:
+        return [], recommendation.updated_at
+
+    return json.loads(recommendation.recipes), recommendation.updated_at
@@ -0,0 +1,71 @@
+// 「もっと見る」：続きのHTMLを取得して一覧の末尾に追加する
+// ボタンが画面に近づいたら自動で読み込む（IntersectionObserverが無ければクリックのみ）
+(function() {
+    const observer = 'IntersectionObserver' in window
+        ? new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    loadMore(entry.target);
+                }
+            });
+        }, { rootMargin: '200px' })
+        : null;
+
+    function setup(root) {
+        root.querySelectorAll('.load-more-btn').forEach(button => {
+            button.addEventListener('click', function(e) {
+                e.preventDefault();
+                loadMore(this);
+            });
+            if (observer) {
+                observer.observe(button);
+            }
+        });
+    }
+
+    function loadMore(button) {
+        if (button.dataset.loading) {
+            return;
+        }
+        button.dataset.loading = '1';
+        if (observer) {
+            observer.unobserve(button);
+        }
+        button.textContent = '読み込み中...';
+
+        fetch(button.dataset.url, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.text();
+            })
+            .then(html => {
+                const template = document.createElement('template');
+                template.innerHTML = html;
+                const next = template.content.querySelector('.load-more');
+                if (next) {
+                    next.remove();
+                }
+                document.querySelector(button.dataset.target).appendChild(template.content);
+
+                const wrapper = button.closest('.load-more');
+                if (next) {
+                    wrapper.replaceWith(next);
+                    setup(next);
+                } else {
+                    wrapper.remove();
+                }
+                document.dispatchEvent(new CustomEvent('loadmore:appended'));
+            })
+            .catch(error => {
+                console.error('Load more error:', error);
+                delete button.dataset.loading;
+                button.textContent = '読み込みに失敗しました（クリックで再試行）';
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        setup(document);
+    });
+})();
@@ -0,0 +1,187 @@
+import os
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from models import db, RecipeHistory, RecipeHistoryClear
+
+
+# ====================
+# 閲覧履歴の書き込みをまとめる（write-behind）
+# ====================
+"""
+レシピのクリックごとに同期でSQLiteへ書き込むと、一番よく使われる操作が書き込みロックを待つ。
+/record_view はメモリ上のバッファに積むだけですぐに204を返し、
+裏のスレッドが一定間隔（または件数が溜まったとき）にまとめて書き込む。
+・同じユーザー・同じURLの閲覧はバッファ内で最新の1件にまとめる
+・書き込みは (user_id, url) のユニーク制約を使った INSERT ... ON CONFLICT DO UPDATE でまとめて行う
+・50件を超えた古い履歴は、書き込んだユーザーの分をROW_NUMBER()で1回のDELETEで削除する
+履歴ページの表示・削除の前には flush_views() で未書き込みの分を反映する。
+flush_views() が反映できるのは自分のプロセスのバッファだけなので、
+複数のワーカーで動かしても履歴のクリアが戻らないよう、クリアした日時（recipe_history_clear）より前の閲覧は
+書き込みと同じトランザクションで消す。既存の行をより古い閲覧日時で上書きすることもしない。
+"""
+
+VIEW_FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_INTERVAL', '2.0'))  # 秒
+VIEW_FLUSH_BATCH = int(os.environ.get('VIEW_FLUSH_BATCH', '200'))  # この件数が溜まったらすぐ書き込む
+VIEW_BUFFER_MAX = int(os.environ.get('VIEW_BUFFER_MAX', '10000'))  # 書き込み失敗が続いたときの上限
+HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', '50'))  # ユーザーごとに残す履歴の件数
+
+
+class ViewTracker:
+    """閲覧をバッファに積み、裏のスレッドでまとめて書き込む"""
+
+    def __init__(self):
+        self._buffer = {}  # (user_id, url) -> 行の値
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 書き込みは同時に1つだけ
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._app = None
+        self.stats = {'recorded': 0, 'flushed': 0, 'batches': 0, 'trimmed': 0, 'discarded': 0, 'errors': 0, 'dropped': 0}
+
+    def _start(self):
+        # 最初の記録時にアプリを覚えてスレッドを起動する
+        self._app = current_app._get_current_object()
+        self._thread = threading.Thread(target=self._run, name='view-tracker', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def record(self, user_id, title, url, img, source):
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            # dictの順序を最新の閲覧順にするため、既存のキーは入れ直す
+            self._buffer.pop((user_id, url), None)
+            self._buffer[(user_id, url)] = {
+                'user_id': user_id,
+                'title': title,
+                'url': url,
+                'img': img,
+                'source': source,
+                'viewed_at': datetime.utcnow(),
+            }
+            self.stats['recorded'] += 1
+            full = len(self._buffer) >= VIEW_FLUSH_BATCH
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(VIEW_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[HISTORY ERROR] Flush loop failed: {e}")
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """バッファの内容を書き込む（書き込んだ件数を返す）"""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, {}
+            if not rows:
+                return 0
+            with self._app.app_context():
+                try:
+                    discarded, trimmed = self._write(list(rows.values()))
+                except Exception as e:
+                    db.session.rollback()
+                    self._restore(rows)
+                    self.stats['errors'] += 1
+                    print(f"[HISTORY ERROR] Flush of {len(rows)} views failed: {e}")
+                    return 0
+        self.stats['flushed'] += len(rows)
+        self.stats['batches'] += 1
+        self.stats['trimmed'] += trimmed
+        self.stats['discarded'] += discarded
+        print(f"[HISTORY] Flushed {len(rows)} views, discarded {discarded} cleared, trimmed {trimmed} old records")
+        return len(rows)
+
+    def _write(self, rows):
+        # SQLiteのパラメータ数の上限を超えないようにVIEW_FLUSH_BATCH件ずつ
+        for start in range(0, len(rows), VIEW_FLUSH_BATCH):
+            statement = insert(RecipeHistory).values(rows[start:start + VIEW_FLUSH_BATCH])
+            statement = statement.on_conflict_do_update(
+                index_elements=[RecipeHistory.user_id, RecipeHistory.url],
+                set_={
+                    'title': statement.excluded.title,
+                    'img': statement.excluded.img,
+                    'source': statement.excluded.source,
+                    'viewed_at': statement.excluded.viewed_at,
+                },
+                # 他のプロセスがより新しい閲覧を書き込み済みなら上書きしない
+                where=statement.excluded.viewed_at > RecipeHistory.viewed_at,
+            )
+            db.session.execute(statement)
+
+        user_ids = sorted({row['user_id'] for row in rows})
+
+        # クリアした日時より前の閲覧（他のプロセスのバッファに残っていたもの）は消す
+        cleared_at = select(RecipeHistoryClear.cleared_at)\
+            .where(RecipeHistoryClear.user_id == RecipeHistory.user_id)\
+            .scalar_subquery()
+        discarded = db.session.execute(
+            delete(RecipeHistory)
+            .where(RecipeHistory.user_id.in_(user_ids), RecipeHistory.viewed_at <= cleared_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        # 書き込んだユーザーの履歴のうち、新しい順でHISTORY_LIMIT件より後ろを削除
+        ranked = select(
+            RecipeHistory.id,
+            func.row_number().over(
+                partition_by=RecipeHistory.user_id,
+                order_by=(RecipeHistory.viewed_at.desc(), RecipeHistory.id.desc()),
+            ).label('rank'),
+        ).where(RecipeHistory.user_id.in_(user_ids)).subquery()
+        result = db.session.execute(
+            delete(RecipeHistory)
+            .where(RecipeHistory.id.in_(select(ranked.c.id).where(ranked.c.rank > HISTORY_LIMIT)))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return discarded, result.rowcount
+
+    def _restore(self, rows):
+        # 失敗した分はバッファに戻して次回に再試行する（後から来た閲覧の方を優先）
+        with self._lock:
+            for key, row in rows.items():
+                if len(self._buffer) >= VIEW_BUFFER_MAX:
+                    self.stats['dropped'] += 1
+                    continue
+                self._buffer.setdefault(key, row)
+
+
+view_tracker = ViewTracker()
+
+
+def record_view_event(user_id, title, url, img, source):
+    view_tracker.record(user_id, title, url, img, source)
+
+
+def mark_history_cleared(user_id):
+    """履歴をクリアした日時を記録する（クリアと同じトランザクション内で呼び、commitは呼び出し側）"""
+    statement = insert(RecipeHistoryClear).values(user_id=user_id, cleared_at=datetime.utcnow())
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[RecipeHistoryClear.user_id],
+        set_={'cleared_at': statement.excluded.cleared_at},
+    ))
+
+
+def flush_views():
+    """未書き込みの閲覧をすぐに書き込む（履歴の表示・削除の前に呼ぶ）"""
+    if view_tracker.pending():
+        view_tracker.flush()
+
+
+def get_view_tracker_stats():
+    return dict(view_tracker.stats, pending=view_tracker.pending())